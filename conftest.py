@@ -40,6 +40,7 @@ def pytest_sessionstart(session):
 def pytest_addoption(parser):
     # test / explore / live
     parser.addoption("--mode", action="store", default="test")
+    parser.addoption("--benchmark", action="store_true", default=False)
 
 
 @pytest.fixture(scope="session")
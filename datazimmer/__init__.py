@@ -4,6 +4,7 @@ from .aswan_integration import DzAswan
 from .metadata.atoms import EntityClass, parse_df
 from .metadata.datascript import (
     AbstractEntity,
+    Category,
     CompositeTypeBase,
     Index,
     Nullable,
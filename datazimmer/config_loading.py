@@ -1,6 +1,9 @@
+import os
 import re
 from abc import ABCMeta
-from dataclasses import asdict, dataclass, field
+from contextvars import ContextVar
+from copy import deepcopy
+from dataclasses import asdict, dataclass, field, replace
 from pathlib import Path
 from typing import TYPE_CHECKING, Optional, Type, TypeVar, Union
 
@@ -12,6 +15,7 @@ from zimmauth import ZimmAuth
 from .dvc_util import get_default_remote
 from .exceptions import ProjectSetupException
 from .metadata.complete_id import CompleteId
+from .metadata.trepo_io import AppendLogRepo, StoredSchemaRepo
 from .naming import (
     AUTH_HEX_ENV_VAR,
     AUTH_PASS_ENV_VAR,
@@ -31,6 +35,9 @@ logger = get_logger(ctx="config loading")
 
 T = TypeVar("T")
 
+# absolute path -> (mtime, size), parsed yaml
+_RAW_CONF_CACHE: dict[str, tuple[tuple[int, int], dict]] = {}
+
 
 @dataclass
 class ProjectEnv:
@@ -69,6 +76,7 @@ class Config:
     imported_projects: list[ImportedProject] = field(default_factory=list)
     aswan_projects: list[AswanSpec] = field(default_factory=list)
     persistent_states: dict[str, dict] = field(default_factory=dict)
+    arrow_strings: bool = False
 
     def __post_init__(self):
         if not self.envs:
@@ -94,7 +102,11 @@ class Config:
             return _get(self.aswan_projects, name)
 
     def create_trepo(
-        self, id_: CompleteId, partitioning_cols=None, max_partition_size=None
+        self,
+        id_: CompleteId,
+        partitioning_cols=None,
+        max_partition_size=None,
+        append_log=False,
     ):
         envs_of_ns = self.get_data_envs(id_.project, id_.namespace)
         if not envs_of_ns:
@@ -104,7 +116,8 @@ class Config:
             env: get_data_path(id_.project, id_.namespace, env) for env in envs_of_ns
         }
         main_path = parents_dict[default_env] / id_.obj_id
-        return TableRepo(
+        trepo_cls = AppendLogRepo if append_log else StoredSchemaRepo
+        return trepo_cls(
             main_path,
             group_cols=partitioning_cols,
             max_records=max_partition_size or 0,
@@ -149,6 +162,7 @@ class Config:
             d[k] = {e.pop("name"): e for e in d[k]}
         d[CONF_KEYS.version] = f"v{d[CONF_KEYS.version]}"
         BASE_CONF_PATH.write_text(yaml.safe_dump(d))
+        _RAW_CONF_CACHE.pop(os.path.abspath(BASE_CONF_PATH), None)
 
     @classmethod
     def load(cls):
@@ -169,10 +183,23 @@ class Config:
 
     def _update_raw(self, dic: dict):
         BASE_CONF_PATH.write_text(yaml.dump(self._load_raw() | dic, sort_keys=False))
+        _RAW_CONF_CACHE.pop(os.path.abspath(BASE_CONF_PATH), None)
 
     @classmethod
     def _load_raw(cls):
-        return _yaml_or_err(BASE_CONF_PATH)
+        """parsed only if the file changed since the last load in the process"""
+        path = os.path.abspath(BASE_CONF_PATH)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            _RAW_CONF_CACHE.pop(path, None)
+            return _yaml_or_err(BASE_CONF_PATH)
+        file_key = (stat.st_mtime_ns, stat.st_size)
+        cached = _RAW_CONF_CACHE.get(path)
+        if (cached is None) or (cached[0] != file_key):
+            cached = _RAW_CONF_CACHE[path] = (file_key, _yaml_or_err(BASE_CONF_PATH))
+        # the loaded configs are modified in place, they can't share the dict
+        return deepcopy(cached[1])
 
 
 _DC_ATTRIBUTES = {  # what attributes of config need parsing as dataclasses
@@ -197,22 +224,48 @@ class _IoConf:
 
 @dataclass
 class RunConfig(_IoConf):
+    """the active one is kept in a context variable of the process,
+    the file only hands it over to subprocesses"""
+
     profile: bool = False
     write_env: Optional[str] = None
     read_env: Optional[str] = None
     reset_aswan: bool = False
 
     def __enter__(self):
+        token = _ACTIVE_RUN_CONF.set(self)
         self.dump()
+        self._token = token
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._cpath().unlink()
+        self._cpath().unlink(missing_ok=True)
+        _ACTIVE_RUN_CONF.reset(self._token)
+
+    def dump(self):
+        super().dump()
+        self.activate()
+
+    def activate(self):
+        """sets it for this context only, without handing it to subprocesses"""
+        _ACTIVE_RUN_CONF.set(replace(self))
+
+    @classmethod
+    def load(cls):
+        active = _ACTIVE_RUN_CONF.get()
+        if active is None:
+            return super().load()
+        return replace(active)
 
     @classmethod
     def _cpath(cls):
         return RUN_CONF_PATH
 
 
+_ACTIVE_RUN_CONF: ContextVar[Optional[RunConfig]] = ContextVar(
+    "active_run_conf", default=None
+)
+
+
 @dataclass
 class UserConfig(_IoConf):
     first_name: str
@@ -1,3 +1,5 @@
+import json
+import os
 import venv
 from pathlib import Path
 from subprocess import check_output
@@ -10,6 +12,7 @@ from .naming import BASE_CONF_PATH
 logger = get_logger("dvc-util")
 
 DVC_ENV_DIR = Path.home() / ".dvc-env"
+DVC_YAML_PATH = Path("dvc.yaml")
 
 
 def setup_dvc(update: bool = False):
@@ -40,9 +43,7 @@ def add(file):
 
 
 def list_stages():
-    if not Path("dvc.yaml").exists():
-        return []
-    return run_dvc("stage", "list", "--name-only").strip().split()
+    return list(_read_dvc_yaml().get("stages", {}).keys())
 
 
 def remove(stage_name):
@@ -53,19 +54,49 @@ def reproduce(targets):
     return run_dvc("repro", "--pull", *(targets or [])).strip()
 
 
-def add_stage(cmd, name, outs_no_cache, outs, outs_persist, deps, params):
-    comms = ["stage", "add", "-n", name, "-f"]
-    for k, v in {
-        "-o": outs,
-        "-O": outs_no_cache,
-        "--outs-persist": outs_persist,
-        "-d": deps,
-        "-p": params,
-    }.items():
-        for e in v or []:
-            comms += [k, e]
+def status(targets, with_deps=False) -> dict:
+    """changes of the stages that are not up to date, by stage name
 
-    run_dvc(*comms, cmd)
+    with_deps also reports the upstream stages of the targets
+    """
+    dep_arg = ("--with-deps",) if with_deps else ()
+    return json.loads(run_dvc("status", "--json", *dep_arg, *(targets or [])) or "{}")
+
+
+def commit(targets):
+    """records the current deps and outs of stages in dvc.lock, without running"""
+    run_dvc("commit", "-f", *targets)
+
+
+def get_stage_def(cmd, outs_no_cache, outs, outs_persist, deps, param_ids) -> dict:
+    """a stage the way dvc stage add would write it to dvc.yaml"""
+    stage = {"cmd": cmd}
+    if deps:
+        stage["deps"] = list(deps)
+    if param_ids:
+        stage["params"] = [{BASE_CONF_PATH.as_posix(): list(param_ids)}]
+    all_outs = [
+        *(outs or []),
+        *[{o: {"cache": False}} for o in outs_no_cache or []],
+        *[{o: {"persist": True}} for o in outs_persist or []],
+    ]
+    if all_outs:
+        stage["outs"] = all_outs
+    return stage
+
+
+def write_stages(stages: dict[str, dict]):
+    """sets the stages of dvc.yaml at once, keeping anything else in it
+
+    the file is only replaced if the stages differ
+    """
+    dvc_yaml = _read_dvc_yaml()
+    if dvc_yaml.get("stages") == stages:
+        return
+    dvc_yaml["stages"] = stages
+    tmp_path = DVC_YAML_PATH.with_name(f"{DVC_YAML_PATH.name}.tmp")
+    tmp_path.write_text(yaml.safe_dump(dvc_yaml, sort_keys=False))
+    os.replace(tmp_path, DVC_YAML_PATH)
 
 
 def get_locked_param(stage_name, param):
@@ -95,5 +126,11 @@ def get_dvc_venv_exec():
     return venv.EnvBuilder().ensure_directories(DVC_ENV_DIR).env_exec_cmd
 
 
+def _read_dvc_yaml() -> dict:
+    if not DVC_YAML_PATH.exists():
+        return {}
+    return yaml.safe_load(DVC_YAML_PATH.read_text()) or {}
+
+
 def _erun(*comm):
     return check_output([get_dvc_venv_exec(), *comm]).decode()
@@ -8,3 +8,12 @@ class ProjectRuntimeException(Exception):
 
 class NotADzObject(Exception):
     pass
+
+
+class DataConstraintException(Exception):
+    """the offending rows of each violated constraint are in violations"""
+
+    def __init__(self, violations: dict) -> None:
+        self.violations = violations
+        counts = {k: v.shape[0] for k, v in violations.items()}
+        super().__init__(f"constraint violations (rows): {counts}")
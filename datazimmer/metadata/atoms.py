@@ -1,16 +1,19 @@
 from abc import abstractmethod
 from dataclasses import dataclass, field
-from functools import partial
-from typing import List, Optional, TypeVar, Union
+from functools import cached_property, partial
+from typing import Callable, Iterable, List, Optional, TypeVar, Union
 
+import numpy as np
 import pandas as pd
 import sqlalchemy as sa
 from colassigner.constants import PREFIX_SEP
 from structlog import get_logger
 
+from ..exceptions import DataConstraintException
 from ..utils import PRIMITIVE_MODULES, chainmap, get_simplified_mro
 from .datascript import (
     AbstractEntity,
+    Category,
     CompositeTypeBase,
     IndexIndicator,
     Nullable,
@@ -25,6 +28,11 @@ logger = get_logger("atoms")
 _GLOBAL_CLS_MAP: dict[type, "_AtomBase"] = {}
 T = TypeVar("T")
 
+DOMAINS_T = Optional[dict[str, Union[Iterable, Callable[[pd.Series], pd.Series]]]]
+# with check="auto", larger frames only get a sample of rows checked
+CHECK_FULL_ROWS = 1_000_000
+CHECK_SAMPLE_ROWS = 100_000
+
 
 @dataclass
 class PrimitiveFeature:  # ~DataProperty
@@ -88,29 +96,41 @@ class EntityClass(_AtomBase):
     parents: List["EntityClass"] = field(default_factory=list)
     description: Optional[str] = None
 
+    @cached_property
+    def parse_plan(self) -> "ParsePlan":
+        return ParsePlan.from_feats(self.identifiers, self.properties)
+
+    @cached_property
+    def arrow_parse_plan(self) -> "ParsePlan":
+        """parse_plan with str features as arrow backed strings"""
+        return ParsePlan.from_feats(self.identifiers, self.properties, True)
+
+    def get_parse_plan(self, arrow_strings=False) -> "ParsePlan":
+        return self.arrow_parse_plan if arrow_strings else self.parse_plan
+
     @property
     def table_index_dt_map(self):
-        return to_dt_map(self.identifiers)
+        return self.parse_plan.index_dt_map
 
     @property
     def table_feature_dt_map(self):
-        return to_dt_map(self.properties)
+        return self.parse_plan.feature_dt_map
 
     @property
     def table_full_dt_map(self):
-        return self.table_index_dt_map | self.table_feature_dt_map
+        return self.parse_plan.full_dt_map
 
     @property
     def table_index_cols(self):
-        return list(self.table_index_dt_map.keys())
+        return self.parse_plan.index_cols
 
     @property
     def table_feature_cols(self):
-        return list(self.table_feature_dt_map.keys())
+        return self.parse_plan.feature_cols
 
     @property
     def table_all_columns(self):
-        return self.table_index_cols + self.table_feature_cols
+        return self.parse_plan.index_cols + self.parse_plan.feature_cols
 
     def _extend(self, ids, props, ds_cls):
         self.parents = [
@@ -127,6 +147,55 @@ class Column:
     nullable: bool = False
 
 
+@dataclass
+class ForeignKeySpec:
+    columns: list[str]
+    target: EntityClass
+    prefix_arr: tuple
+
+
+@dataclass
+class ParsePlan:
+    """table columns and dtypes of an entity, compiled once per entity"""
+
+    index_columns: list[Column]
+    feature_columns: list[Column]
+    index_fks: list[ForeignKeySpec]
+    feature_fks: list[ForeignKeySpec]
+    arrow_strings: bool = False
+    index_dt_map: dict = field(init=False)
+    feature_dt_map: dict = field(init=False)
+    full_dt_map: dict = field(init=False)
+    index_cols: list[str] = field(init=False)
+    feature_cols: list[str] = field(init=False)
+    required_cols: list[str] = field(init=False)
+    category_bases: dict[str, type] = field(init=False)
+
+    def __post_init__(self):
+        self.index_dt_map = _cols_to_dt_map(self.index_columns, self.arrow_strings)
+        self.feature_dt_map = _cols_to_dt_map(self.feature_columns, self.arrow_strings)
+        self.full_dt_map = self.index_dt_map | self.feature_dt_map
+        self.index_cols = list(self.index_dt_map.keys())
+        self.feature_cols = list(self.feature_dt_map.keys())
+        self.required_cols = [
+            c.name for c in self.index_columns + self.feature_columns if not c.nullable
+        ]
+        self.category_bases = {
+            c.name: c.dtype.base
+            for c in self.index_columns + self.feature_columns
+            if isinstance(c.dtype, Category)
+        }
+
+    @classmethod
+    def from_feats(cls, identifiers: list, properties: list, arrow_strings=False):
+        index_fks, feature_fks = [], []
+        index_columns = feats_to_cols(identifiers, partial(_add_fk_spec, index_fks))
+        feature_columns = feats_to_cols(properties, partial(_add_fk_spec, feature_fks))
+        return cls(
+            index_columns, feature_columns, index_fks, feature_fks, arrow_strings
+        )
+
+
 def feats_to_cols(feats, proc_fk=None, wrap=lambda x: x) -> list[Column]:
     return chainmap(partial(feat_to_cols, proc_fk=proc_fk, wrap=wrap), feats)
 
@@ -160,7 +229,7 @@ def feat_to_cols(feat, proc_fk, wrap, init_prefix=(), open_to_fk=True) -> list:
 
 
 def to_dt_map(feats):
-    return {c.name: get_np_type(c.dtype, c.nullable) for c in feats_to_cols(feats)}
+    return _cols_to_dt_map(feats_to_cols(feats))
 
 
 def to_sa_col(col: Column, pk=False):
@@ -168,23 +237,137 @@ def to_sa_col(col: Column, pk=False):
     return sa.Column(col.name, sa_dt, nullable=col.nullable, primary_key=pk)
 
 
-def parse_df(df: pd.DataFrame, entity: AbstractEntity, verbose=False):
-    entity_class = EntityClass.from_cls(entity)
-    eventual_dic = to_dt_map(entity_class.properties)
-    feat_list = list(eventual_dic.keys())
-    ind_dic = to_dt_map(entity_class.identifiers)
-    set_ind = ind_dic and (set(df.index.names) != set(ind_dic.keys()))
+def parse_df(
+    df: pd.DataFrame,
+    entity: AbstractEntity,
+    verbose=False,
+    copy=True,
+    arrow_strings=False,
+    check: Union[bool, str] = "auto",
+    domains: DOMAINS_T = None,
+):
+    """casts, indexes and orders the columns of df as the entity table needs them
+
+    columns already of the right dtype are not cast, and with copy=False
+    they are not copied either, the output shares their memory with df
+
+    with arrow_strings, str features become arrow backed string columns
+
+    check: True, False or "auto", how the output is checked with check_df
+    """
+    plan = EntityClass.from_cls(entity).get_parse_plan(arrow_strings)
+    set_ind = plan.index_cols and (set(df.index.names) != set(plan.index_cols))
     if set_ind:
         if verbose:
-            logger.info("indexing needed", inds=ind_dic)
-        eventual_dic.update(ind_dic)
+            logger.info("indexing needed", inds=plan.index_dt_map)
+        eventual_dic = plan.feature_dt_map | plan.index_dt_map
+    else:
+        eventual_dic = plan.feature_dt_map
 
     missing_cols = set(eventual_dic.keys()) - set(df.columns)
     if missing_cols:
         logger.warning(f"missing from columns {missing_cols}", present=df.columns)
-    out = df.astype(eventual_dic)
-    indexed_out = out.set_index(list(ind_dic.keys())) if set_ind else out
-    return indexed_out.loc[:, list(feat_list)]
+    out = df.copy(deep=False)
+    for col, dtype in eventual_dic.items():
+        base = plan.category_bases.get(col)
+        if (col in missing_cols) or not _conforms(df[col], dtype, base):
+            out[col] = _cast(df[col], dtype, base)
+    if set_ind:
+        out.set_index(plan.index_cols, inplace=True)
+    if list(out.columns) == plan.feature_cols:
+        out = out.copy() if copy else out
+    elif copy or not plan.feature_cols:
+        out = out.loc[:, plan.feature_cols]
+    else:
+        out = pd.concat([out[c] for c in plan.feature_cols], axis=1, copy=False)
+    if check:
+        check_df(out, entity, domains, check)
+    return out
+
+
+def check_df(
+    df: pd.DataFrame,
+    entity: AbstractEntity,
+    domains: DOMAINS_T = None,
+    check: Union[bool, str] = True,
+):
+    """raises DataConstraintException with all offending rows of a parsed df
+
+    checks index uniqueness, nulls in features that are not Nullable
+    and the domains: allowed values or a function giving a boolean mask by column
+
+    with check="auto" frames over CHECK_FULL_ROWS are only checked in
+    a sample of CHECK_SAMPLE_ROWS rows for nulls and domains, not for uniqueness
+    """
+    plan = EntityClass.from_cls(entity).parse_plan
+    violations = {}
+    if (check == "auto") and (df.shape[0] > CHECK_FULL_ROWS):
+        df = df.sample(CHECK_SAMPLE_ROWS)
+    elif plan.index_cols:
+        dup_mask = df.index.duplicated(keep=False)
+        if dup_mask.any():
+            violations["duplicate index"] = df.loc[dup_mask, :]
+    for col in plan.required_cols:
+        null_mask = _get_values(df, col).isna().values
+        if null_mask.any():
+            violations[f"null {col}"] = df.loc[null_mask, :]
+    for col, domain in (domains or {}).items():
+        values = _get_values(df, col)
+        in_domain = domain(values) if callable(domain) else values.isin(domain)
+        out_mask = (~in_domain & values.notna()).values
+        if out_mask.any():
+            violations[f"domain {col}"] = df.loc[out_mask, :]
+    if violations:
+        raise DataConstraintException(violations)
+
+
+def _cast(col: pd.Series, dtype, base=None) -> pd.Series:
+    if base is not None:
+        return _to_category(col, base)
+    if (dtype is str) and col.hasnans:
+        # not to turn nulls into "None" and "nan" strings, unseen by the checks
+        return col.astype(str).where(col.notna())
+    return col.astype(dtype)
+
+
+def _to_category(col: pd.Series, base) -> pd.Series:
+    """categorical with categories of the base type, nulls kept"""
+    present = col.notna().values
+    values = _cast(col[present].astype(object), get_np_type(base, False))
+    categories = pd.Index(values.unique())
+    codes = np.full(col.shape[0], -1)
+    codes[present] = categories.get_indexer(values)
+    cat = pd.Categorical.from_codes(codes, categories=categories)
+    return pd.Series(cat, index=col.index, name=col.name)
+
+
+def _conforms(col: pd.Series, dtype, base=None) -> bool:
+    if base is not None:
+        # "category" matches categoricals of any categories
+        if not isinstance(col.dtype, pd.CategoricalDtype):
+            return False
+        return _conforms(pd.Series(col.cat.categories), get_np_type(base, False))
+    if dtype is str:
+        inferred = pd.api.types.infer_dtype(col, skipna=False)
+        return (col.dtype == object) and (inferred in ["string", "empty"])
+    try:
+        return col.dtype == pd.api.types.pandas_dtype(dtype)
+    except TypeError:
+        return False
+
+
+def _get_values(df: pd.DataFrame, col: str) -> pd.Series:
+    if col in df.columns:
+        return df[col]
+    return df.index.get_level_values(col).to_series(index=df.index)
+
+
+def _cols_to_dt_map(cols: list[Column], arrow_strings=False):
+    return {c.name: get_np_type(c.dtype, c.nullable, arrow_strings) for c in cols}
+
+
+def _add_fk_spec(specs: list, cols: list[Column], target: EntityClass, prefix_arr):
+    specs.append(ForeignKeySpec([c.name for c in cols], target, prefix_arr))
 
 
 def _ds_cls_to_feat_dicts(ds_cls: Union[EntityClass, CompositeType]):
@@ -201,7 +384,7 @@ def _ds_cls_to_feat_dicts(ds_cls: Union[EntityClass, CompositeType]):
         if IndexIndicator in bases:
             to_l = ids
             cls = bases[1]
-        if cls.__module__ in PRIMITIVE_MODULES:
+        if isinstance(cls, Category) or (cls.__module__ in PRIMITIVE_MODULES):
             parsed_feat = PrimitiveFeature(name=k, dtype=cls, nullable=nullable)
         elif AbstractEntity in bases:
             entity_class = EntityClass.from_cls(cls)
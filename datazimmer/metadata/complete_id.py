@@ -5,7 +5,7 @@ from ..exceptions import NotADzObject
 from ..naming import MAIN_MODULE_NAME, META_MODULE_NAME, from_mod_name
 
 
-@dataclass
+@dataclass(frozen=True)
 class CompleteId:
     """bedrock id with a namespace prefix
 
@@ -2,6 +2,7 @@ from datetime import datetime
 from enum import Enum
 from typing import Type, TypeVar, Union
 
+import numpy as np
 import sqlalchemy as sa
 from colassigner import ColAssigner, get_att_value
 from colassigner.type_hinting import get_return_hint
@@ -10,6 +11,8 @@ from ..utils import get_creation_module_name
 
 T = TypeVar("T")
 
+ARROW_STRING_DTYPE = "string[pyarrow]"
+
 SA_TYPE_MAP = {
     int: sa.Integer,
     float: sa.Float,
@@ -17,17 +20,41 @@ SA_TYPE_MAP = {
     bytes: sa.LargeBinary,
     bool: sa.Boolean,
     datetime: sa.DateTime,
+    np.int8: sa.SmallInteger,
+    np.int16: sa.SmallInteger,
+    np.int32: sa.Integer,
+    np.int64: sa.BigInteger,
+    np.float32: sa.Float,
+    np.float64: sa.Float,
+    np.bool_: sa.Boolean,
+}
+
+# masked extension dtypes so that nulls do not turn ints and bools to floats
+NULLABLE_DTYPE_MAP = {
+    str: object,
+    int: "Int64",
+    bool: "boolean",
+    np.int8: "Int8",
+    np.int16: "Int16",
+    np.int32: "Int32",
+    np.int64: "Int64",
+    np.bool_: "boolean",
 }
 
 
 class PrimitiveType(Enum):
-    # TODO: categorical
     float = float
     int = int
     str = str
     bytes = bytes
     bool = bool
     datetime = datetime
+    int8 = np.int8
+    int16 = np.int16
+    int32 = np.int32
+    int64 = np.int64
+    float32 = np.float32
+    float64 = np.float64
 
 
 class SourceUrl(str):
@@ -51,6 +78,15 @@ class Nullable(type):
         return super().__new__(cls, dtype.__name__, (), {"base": dtype})
 
 
+class Category(type):
+    """a primitive type stored dictionary encoded, for few distinct values"""
+
+    base: Type
+
+    def __new__(cls, dtype):
+        return super().__new__(cls, dtype.__name__, (), {"base": dtype})
+
+
 class _IMeta(type):
     def __and__(cls, other: T) -> T:
         return type(other.__name__, (other, IndexIndicator), {})
@@ -75,10 +111,16 @@ def get_feature_dict(cls: Union[CompositeTypeBase, AbstractEntity]):
 
 
 def get_sa_type(dtype: Type):
+    if isinstance(dtype, Category):
+        dtype = dtype.base
     return SA_TYPE_MAP[dtype]
 
 
-def get_np_type(dtype: Type, nullable: bool):
-    if nullable and (dtype == str):
-        dtype = object
+def get_np_type(dtype: Type, nullable: bool, arrow_strings: bool = False):
+    if isinstance(dtype, Category):
+        return "category"
+    if arrow_strings and (dtype == str):
+        return ARROW_STRING_DTYPE
+    if nullable:
+        dtype = NULLABLE_DTYPE_MAP.get(dtype, dtype)
     return {datetime: "datetime64[ns]"}.get(dtype, dtype)
@@ -3,6 +3,7 @@ from collections import defaultdict
 from dataclasses import dataclass, field
 from functools import total_ordering
 from itertools import chain
+from typing import Iterable, Optional
 
 from structlog import get_logger
 
@@ -28,13 +29,19 @@ class NamespaceMetadata:
     source_urls: list[SourceUrl] = field(default_factory=list)
     pipeline_elements: list[PipelineElement] = field(default_factory=list)
     aswan_projects: list[type[DzAswan]] = field(default_factory=list)
+    _tables_by_ec: dict[str, list[ScruTable]] = field(
+        init=False, repr=False, compare=False
+    )
 
-    def get_table_of_ec(self, ec: EntityClass) -> ScruTable:
-        for table in self.tables:
-            if table.entity_class == ec:
-                return table
+    def __post_init__(self):
+        self._tables_by_ec = index_tables_by_ec(self.tables)
+
+    def get_table_of_ec(self, ec: EntityClass) -> Optional[ScruTable]:
+        return first_table_of_ec(self._tables_by_ec, ec)
 
     def add_obj(self, obj):
+        if isinstance(obj, ScruTable):
+            self._tables_by_ec.setdefault(obj.entity_class.name, []).append(obj)
         for cls, l in [
             (ScruTable, self.tables),
             (SourceUrl, self.source_urls),
@@ -78,7 +85,7 @@ class ProjectMetadata:
     def __post_init__(self):
         self.complete = NsCollection(self)
 
-    def table_of_ec(self, ec: EntityClass) -> ScruTable:
+    def table_of_ec(self, ec: EntityClass) -> Optional[ScruTable]:
         for ns in self.namespaces.values():
             _tab = ns.get_table_of_ec(ec)
             if _tab:
@@ -155,3 +162,20 @@ class DataVersion:
 
 class PROJ_KEYS(ProjectMetadata, metaclass=KeyMeta):
     pass
+
+
+def index_tables_by_ec(tables: Iterable[ScruTable]) -> dict[str, list[ScruTable]]:
+    """tables by the name of their entity class, in their original order"""
+    out = {}
+    for table in tables:
+        out.setdefault(table.entity_class.name, []).append(table)
+    return out
+
+
+def first_table_of_ec(
+    tables_by_ec: dict[str, list[ScruTable]], ec: EntityClass
+) -> Optional[ScruTable]:
+    # equality only needs to be checked among the few tables with the same name
+    for table in tables_by_ec.get(ec.name, []):
+        if table.entity_class == ec:
+            return table
@@ -0,0 +1,182 @@
+import datetime as dt
+import json
+import os
+import pickle
+from bisect import bisect_left
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from atqo import get_lock
+from parquetranger.core import GB_KEY
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+_PRUNERS = {
+    "=": lambda mn, mx, v: mn <= v <= mx,
+    "==": lambda mn, mx, v: mn <= v <= mx,
+    "<": lambda mn, mx, v: mn < v,
+    "<=": lambda mn, mx, v: mn <= v,
+    ">": lambda mn, mx, v: mx > v,
+    ">=": lambda mn, mx, v: mx >= v,
+    "in": lambda mn, mx, vals: _any_between(mn, mx, vals),
+}
+_DECODERS = {
+    "timestamp": pd.Timestamp,
+    "date32": dt.date.fromisoformat,
+    "date64": dt.date.fromisoformat,
+}
+
+
+@dataclass
+class FileEntry:
+    """what a write leaves to know about a parquet file without opening it
+
+    entries are trusted only while the size and mtime of the file match
+    """
+
+    rows: int
+    bytes: int
+    mtime: int
+    partition: Optional[dict]
+    columns: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_path(cls, path: Path, stat: Optional[os.stat_result] = None):
+        stat = stat or path.stat()
+        meta = pq.ParquetFile(path).metadata
+        schema = meta.schema.to_arrow_schema()
+        raw_gb = (schema.metadata or {}).get(GB_KEY.encode())
+        partition = _json_partition(pickle.loads(raw_gb) if raw_gb else {})
+        columns = {}
+        for name in schema.names:
+            type_ = schema.field(name).type
+            col_stats = [_col_stats(meta, i, name) for i in range(meta.num_row_groups)]
+            columns[name] = _merge_stats(col_stats, type_)
+        return cls(meta.num_rows, stat.st_size, stat.st_mtime_ns, partition, columns)
+
+    def matches(self, stat: os.stat_result) -> bool:
+        return (self.bytes == stat.st_size) and (self.mtime == stat.st_mtime_ns)
+
+    def may_pass(self, filters: list) -> bool:
+        """false only if the column statistics rule out every filtered record"""
+        for col, op_str, value in filters:
+            stats = self.columns.get(col, {})
+            if stats.get("min") is None or op_str not in _PRUNERS:
+                continue
+            mn, mx = _decode(stats["min"], stats), _decode(stats["max"], stats)
+            try:
+                if not _PRUNERS[op_str](mn, mx, value):
+                    return False
+            except TypeError:
+                continue
+        return True
+
+
+@dataclass
+class Manifest:
+    """row counts and column statistics of the files of a trepo, by file
+
+    kept next to the trepo files, keys are paths relative to the env parent
+    """
+
+    root: Path
+    files: dict[str, FileEntry] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path, root: Path) -> "Manifest":
+        if not path.exists():
+            return cls(root)
+        raw = json.loads(path.read_text())
+        return cls(root, {k: FileEntry(**v) for k, v in raw.items()})
+
+    def dump(self, path: Path):
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({k: asdict(v) for k, v in self.files.items()}))
+        tmp_path.replace(path)
+
+    def refresh(self, paths: Iterable[Path]) -> "Manifest":
+        """only reads the footers of files that changed since the last refresh"""
+        files = {}
+        for path in paths:
+            stat = path.stat()
+            entry = self.files.get(self._key(path))
+            if (entry is None) or not entry.matches(stat):
+                entry = FileEntry.from_path(path, stat)
+            files[self._key(path)] = entry
+        return Manifest(self.root, files)
+
+    def get_entry(self, path: Path) -> Optional[FileEntry]:
+        entry = self.files.get(self._key(path))
+        if (entry is not None) and path.exists() and entry.matches(path.stat()):
+            return entry
+
+    @property
+    def rows(self) -> int:
+        return sum(e.rows for e in self.files.values())
+
+    @property
+    def bytes(self) -> int:
+        return sum(e.bytes for e in self.files.values())
+
+    def _key(self, path: Path) -> str:
+        return path.relative_to(self.root).as_posix()
+
+
+def update_manifest(manifest_path: Path, root: Path, paths: Iterable[Path]):
+    with get_lock(f"{manifest_path} - manifest"):
+        Manifest.load(manifest_path, root).refresh(paths).dump(manifest_path)
+
+
+def _any_between(mn, mx, values) -> bool:
+    sorted_values = sorted(values)
+    i = bisect_left(sorted_values, mn)
+    return (i < len(sorted_values)) and (sorted_values[i] <= mx)
+
+
+def _col_stats(meta: pq.FileMetaData, rg_ind: int, name: str):
+    rg = meta.row_group(rg_ind)
+    for j in range(rg.num_columns):
+        col = rg.column(j)
+        if col.path_in_schema == name:
+            return col.statistics
+
+
+def _merge_stats(stats_list: list, type_: pa.DataType) -> dict:
+    if not stats_list or any(s is None for s in stats_list):
+        return {}
+    out = {"null_count": sum(s.null_count for s in stats_list)}
+    if all(s.has_min_max for s in stats_list):
+        try:
+            mn, mx = min(s.min for s in stats_list), max(s.max for s in stats_list)
+        except TypeError:
+            return out
+        out |= {"type": str(type_), "min": _jsonable(mn), "max": _jsonable(mx)}
+    return out
+
+
+def _decode(value, stats: dict):
+    for prefix, decoder in _DECODERS.items():
+        if stats.get("type", "").startswith(prefix):
+            return decoder(value)
+    return value
+
+
+def _json_partition(gb_values: dict) -> Optional[dict]:
+    """none if the values would not come back the same from json"""
+    out = {k: getattr(v, "item", lambda: v)() for k, v in gb_values.items()}
+    if all(isinstance(v, (str, int, float, bool)) for v in out.values()):
+        return out
+
+
+def _jsonable(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return None
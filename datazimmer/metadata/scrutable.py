@@ -1,20 +1,41 @@
 from contextlib import contextmanager
-from dataclasses import dataclass
-from typing import Callable, Optional, TypeVar
+from dataclasses import dataclass, field, replace
+from functools import partial
+from itertools import groupby
+from typing import Callable, Iterable, Optional, TypeVar, Union
 
 import pandas as pd
+import pyarrow as pa
 from colassigner.meta_base import ColMeta
 from structlog import get_logger
 
 from ..config_loading import Config, RunConfig, UnavailableTrepo
 from ..exceptions import ProjectRuntimeException
 from ..utils import camel_to_snake, get_creation_module_name
-from .atoms import EntityClass, parse_df
+from .atoms import DOMAINS_T, EntityClass, check_df, parse_df
 from .complete_id import CompleteId, CompleteIdBase
 from .datascript import AbstractEntity
+from .trepo_io import (
+    ARROW_STRINGS,
+    FILTERS_T,
+    count_rows,
+    get_manifest,
+    iter_batches,
+    iter_dfs,
+    map_partitions,
+    read_full_df,
+    read_full_table,
+    read_head,
+    read_records,
+    read_sample,
+    read_schema,
+    write_manifest,
+)
 
 logger = get_logger()
 
+_EXTEND, _REPLACE = "extend", "replace_records"
+
 T = TypeVar("T")
 
 
@@ -25,6 +46,11 @@ class ScruTable:
         entity_key_table_map: Optional[dict[str, "ScruTable"]] = None,
         partitioning_cols: Optional[list[str]] = None,
         max_partition_size: Optional[int] = None,
+        memory_map: bool = False,
+        append_log: bool = False,
+        arrow_strings: Optional[bool] = None,
+        checks: Union[bool, str] = "auto",
+        domains: DOMAINS_T = None,
     ) -> None:
         # TODO: somehow add possibility for a description
 
@@ -38,20 +64,35 @@ class ScruTable:
         self.name = self.id_.obj_id
         self.index = self.entity_class.identifiers
         self.features = self.entity_class.properties
-        self.index_map = self.entity_class.table_index_dt_map
-        self.features_map = self.entity_class.table_feature_dt_map
-        self.dtype_map = self.entity_class.table_full_dt_map
-        self.index_cols = self.entity_class.table_index_cols
-        self.feature_cols = self.entity_class.table_feature_cols
-        self.all_cols = self.entity_class.table_all_columns
+        if arrow_strings is None:
+            arrow_strings = self._conf.arrow_strings
+        self.arrow_strings = arrow_strings
+        self.parse_plan = self.entity_class.get_parse_plan(arrow_strings)
+        self.index_map = self.parse_plan.index_dt_map
+        self.features_map = self.parse_plan.feature_dt_map
+        self.dtype_map = self.parse_plan.full_dt_map
+        self.index_cols = self.parse_plan.index_cols
+        self.feature_cols = self.parse_plan.feature_cols
+        self.all_cols = self.index_cols + self.feature_cols
+        self.checks = checks
+        self.domains = domains
 
         self.partitioning_cols = partitioning_cols
         self.max_partition_size = max_partition_size
+        self.append_log = append_log
         self.trepo = self._conf.create_trepo(
-            self.id_, self.partitioning_cols, self.max_partition_size
+            self.id_, self.partitioning_cols, self.max_partition_size, append_log
+        )
+        self.memory_map = memory_map
+        self._read_kwargs = {"memory_map": memory_map}
+        self._df_kwargs = self._read_kwargs | (
+            {"dtype_backend": ARROW_STRINGS} if arrow_strings else {}
         )
-        self.get_full_df = self._read_wrap(self.trepo.get_full_df)
-        self.map_partitions = self._read_wrap(self.trepo.map_partitions)
+        self.get_full_df = self._read_wrap(read_full_df, **self._df_kwargs)
+        self.iter_dfs = self._read_wrap(iter_dfs, **self._df_kwargs)
+        self.get_full_arrow = self._read_wrap(read_full_table, **self._read_kwargs)
+        self.iter_arrow_batches = self._read_wrap(iter_batches, **self._read_kwargs)
+        self.map_partitions = self._read_wrap(map_partitions, **self._df_kwargs)
 
         self.extend = self._write_wrap(self.trepo.extend)
         self.replace_all = self._write_wrap(self.trepo.replace_all)
@@ -61,9 +102,31 @@ class ScruTable:
     def __repr__(self) -> str:
         return f"{type(self).__name__}({self.name}, {self.__module__})"
 
-    def purge(self):
-        with self.env_ctx(RunConfig.load().write_env):
+    def __bool__(self) -> bool:
+        # a table is truthy even when empty, len does not decide it
+        return True
+
+    def __len__(self) -> int:
+        with self.env_ctx(RunConfig.load().read_env):
+            return count_rows(self.trepo)
+
+    def purge(self, env=None):
+        with self.env_ctx(env or RunConfig.load().write_env):
             self.trepo.purge()
+            write_manifest(self.trepo)
+
+    def compact(self, env=None):
+        """merges the delta files of an append_log table into its base files"""
+        if not self.append_log:
+            return
+        with self.env_ctx(env or RunConfig.load().write_env):
+            self.trepo.compact()
+            write_manifest(self.trepo)
+
+    def get_manifest(self, env=None):
+        """file sizes, row counts and column statistics, kept up to date on writes"""
+        with self.env_ctx(env or RunConfig.load().read_env):
+            return get_manifest(self.trepo)
 
     def get_partition_paths(self, partition_col, env=None):
         with self.env_ctx(env or RunConfig.load().read_env):
@@ -78,9 +141,95 @@ class ScruTable:
 
     @property
     def dfs(self):
-        with self.env_ctx(RunConfig.load().read_env):
-            for _df in self.trepo.dfs:
-                yield _df
+        return self.iter_dfs()
+
+    def head(self, n: int = 5, env=None, **kwargs) -> pd.DataFrame:
+        """first n records, reading only the row groups needed"""
+        with self.env_ctx(env or RunConfig.load().read_env):
+            return read_head(self.trepo, n, **(self._df_kwargs | kwargs))
+
+    def sample(
+        self,
+        n: Optional[int] = None,
+        frac: Optional[float] = None,
+        seed: Optional[int] = None,
+        env=None,
+        **kwargs,
+    ) -> pd.DataFrame:
+        with self.env_ctx(env or RunConfig.load().read_env):
+            _kws = self._df_kwargs | kwargs
+            return read_sample(self.trepo, n, frac, seed, **_kws)
+
+    def get_records(self, keys, columns: Optional[list] = None, env=None):
+        """records of the index values in keys, missing ones are left out
+
+        keys can be a list of values (or of tuples, for multiple index columns),
+        an index or a dataframe with the index columns
+        """
+        if not self.index:
+            raise TypeError(f"{self} has no index to look records up by")
+        with self.env_ctx(env or RunConfig.load().read_env):
+            _kws = self._df_kwargs
+            return read_records(self.trepo, keys, self.index_cols, columns, **_kws)
+
+    def peek_schema(self, env=None) -> pa.Schema:
+        with self.env_ctx(env or RunConfig.load().read_env):
+            return read_schema(self.trepo)
+
+    def query(self, columns: Optional[list] = None, filters: FILTERS_T = None):
+        """lazy read, columns and filters are pushed down to the parquet reads
+
+        filters are (column, operator, value) tuples, all of which need to hold,
+        the ones on partitioning columns skip whole partition files
+        """
+        return TableQuery(self, columns, filters or [])
+
+    @contextmanager
+    def buffered_writer(
+        self,
+        max_rows: Optional[int] = 1_000_000,
+        max_bytes: Optional[int] = None,
+        env=None,
+        parse=True,
+        verbose=True,
+    ):
+        """collects extend and replace_records calls, parses and writes in bulk
+
+        the buffer is flushed when it holds max_rows rows or max_bytes bytes,
+        and when the context exits without an error
+        """
+        writer = BufferedWriter(self, max_rows, max_bytes, env, parse, verbose)
+        yield writer
+        writer.flush()
+
+    def extend_stream(
+        self,
+        dfs: Iterable[pd.DataFrame],
+        chunk_rows: Optional[int] = None,
+        parse=True,
+        env=None,
+        verbose=True,
+    ):
+        """writes the frames as they arrive, without holding all of them in memory
+
+        with chunk_rows, small frames are collected and written together
+
+        a table without partitions is written through one staging file,
+        moved in place once the stream is consumed
+        """
+        self._write_stream(dfs, chunk_rows, parse, env, verbose, replace=False)
+
+    def replace_all_stream(
+        self,
+        dfs: Iterable[pd.DataFrame],
+        chunk_rows: Optional[int] = None,
+        parse=True,
+        env=None,
+        verbose=True,
+    ):
+        """a table without partitions keeps its records if the stream fails,
+        partitioned tables are purged before the stream is consumed"""
+        self._write_stream(dfs, chunk_rows, parse, env, verbose, replace=True)
 
     @contextmanager
     def env_ctx(self, env):
@@ -90,23 +239,62 @@ class ScruTable:
         with self.trepo.env_ctx(true_env):
             yield
 
-    def _read_wrap(self, fun: Callable[..., T]) -> Callable[..., T]:
-        return _RWrap(fun, self.env_ctx)
+    def _read_wrap(self, fun: Callable[..., T], **kwargs) -> Callable[..., T]:
+        return _RWrap(partial(fun, self.trepo, **kwargs), self.env_ctx)
 
     def _write_wrap(self, fun):
-        return _WWrap(fun, self.env_ctx, self._parse_df)
+        return _WWrap(fun, self.env_ctx, self._parse_df, self._after_write)
+
+    def _after_write(self):
+        write_manifest(self.trepo)
+
+    def _write_stream(self, dfs, chunk_rows, parse, env, verbose, replace):
+        env = env or RunConfig.load().write_env
+        with self.env_ctx(env):
+            with self.trepo.stream_writer(replace) as extend:
+                writer = BufferedWriter(
+                    self, chunk_rows or 1, None, env, parse, verbose, extend
+                )
+                for df in dfs:
+                    writer.extend(df)
+                writer.flush()
+            self._after_write()
 
-    def _parse_df(self, df: pd.DataFrame, verbose=True):
+    def _parse_df(self, df: pd.DataFrame, verbose=True, check=None):
         if verbose:
             logger.info("parsing", table=self.name, namespace=self.id_.namespace)
 
-        return parse_df(df, self.abstract_entity, verbose)
+        parsed_df = parse_df(
+            df,
+            self.abstract_entity,
+            verbose,
+            False,
+            self.arrow_strings,
+            self.checks if check is None else check,
+            self.domains,
+        )
+        # sorted index makes the statistics of files and row groups selective
+        if self.index and not parsed_df.index.is_monotonic_increasing:
+            return parsed_df.sort_index()
+        return parsed_df
+
+    @property
+    def _check_args(self):
+        return self.abstract_entity, self.domains, self.checks
 
     def _infer_id(self, entity_cls, initing_module_name):
         id_base = CompleteIdBase.from_module_name(initing_module_name, self._conf.name)
         return id_base.to_id(camel_to_snake(entity_cls.__name__))
 
 
+def _run_key(batch: tuple[str, pd.DataFrame]):
+    return batch[0], list(batch[1].index.names)
+
+
+def _over(value: int, limit: Optional[int]):
+    return (limit is not None) and (value >= limit)
+
+
 def _parse_entity_map(entity_map: dict):
     d = {}
     for k, v in (entity_map or {}).items():
@@ -115,6 +303,94 @@ def _parse_entity_map(entity_map: dict):
     return d
 
 
+@dataclass
+class TableQuery:
+    table: ScruTable
+    columns: Optional[list] = None
+    filters: list = field(default_factory=list)
+
+    def select(self, *columns: str) -> "TableQuery":
+        return replace(self, columns=[*(self.columns or []), *columns])
+
+    def where(self, column: str, op: str, value) -> "TableQuery":
+        return replace(self, filters=[*self.filters, (column, op, value)])
+
+    def get_full_df(self, env=None) -> pd.DataFrame:
+        return self.table.get_full_df(env=env, **self._read_kwargs)
+
+    def head(self, n: int = 5, env=None) -> pd.DataFrame:
+        return self.table.head(n, env=env, **self._read_kwargs)
+
+    def sample(self, n=None, frac=None, seed=None, env=None) -> pd.DataFrame:
+        return self.table.sample(n, frac, seed, env=env, **self._read_kwargs)
+
+    def iter_dfs(self, env=None):
+        return self.table.iter_dfs(env=env, **self._read_kwargs)
+
+    def get_full_arrow(self, env=None) -> pa.Table:
+        return self.table.get_full_arrow(env=env, **self._read_kwargs)
+
+    def iter_arrow_batches(self, env=None, **kwargs):
+        return self.table.iter_arrow_batches(env=env, **self._read_kwargs, **kwargs)
+
+    @property
+    def _read_kwargs(self):
+        return {"columns": self.columns, "filters": self.filters or None}
+
+
+@dataclass
+class BufferedWriter:
+    table: ScruTable
+    max_rows: Optional[int] = None
+    max_bytes: Optional[int] = None
+    env: Optional[str] = None
+    parse: bool = True
+    verbose: bool = True
+    extend_fun: Optional[Callable] = None
+    _batches: list[tuple[str, pd.DataFrame]] = field(default_factory=list)
+    _rows: int = 0
+    _bytes: int = 0
+
+    def extend(self, df: pd.DataFrame):
+        self._add(_EXTEND, df)
+
+    def replace_records(self, df: pd.DataFrame):
+        self._add(_REPLACE, df)
+
+    def flush(self):
+        """writes the buffer, one parse and write per run of the same operation"""
+        if not self._batches:
+            return
+        batches, self._batches = self._batches, []
+        self._rows, self._bytes = 0, 0
+        with self.table.env_ctx(self.env or RunConfig.load().write_env):
+            for (op, ind_names), run in groupby(batches, key=_run_key):
+                raw_df = pd.concat(
+                    [b for _, b in run], ignore_index=ind_names == [None]
+                )
+                if self.parse:
+                    df = self.table._parse_df(raw_df, self.verbose, check=False)
+                else:
+                    df = raw_df
+                if op == _REPLACE:
+                    df = df.loc[~df.index.duplicated(keep="last"), :]
+                if self.parse and self.table.checks:
+                    check_df(df, *self.table._check_args)
+                if (op == _EXTEND) and (self.extend_fun is not None):
+                    self.extend_fun(df)
+                else:
+                    getattr(self.table.trepo, op)(df)
+            self.table._after_write()
+
+    def _add(self, op: str, df: pd.DataFrame):
+        self._batches.append((op, df))
+        self._rows += df.shape[0]
+        if self.max_bytes is not None:
+            self._bytes += df.memory_usage(deep=True).sum()
+        if _over(self._rows, self.max_rows) or _over(self._bytes, self.max_bytes):
+            self.flush()
+
+
 @dataclass
 class _RWrap:
     fun: Callable
@@ -130,7 +406,10 @@ class _WWrap:
     fun: Callable
     env_ctx: Callable
     parse_df: Callable
+    after_write: Callable
 
     def __call__(self, df, parse=True, verbose=True, env=None, **kwargs):
         with self.env_ctx(env or RunConfig.load().write_env):
-            return self.fun(self.parse_df(df, verbose) if parse else df, **kwargs)
+            out = self.fun(self.parse_df(df, verbose) if parse else df, **kwargs)
+            self.after_write()
+            return out
@@ -0,0 +1,805 @@
+import json
+import operator as op
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from itertools import chain
+from pathlib import Path
+from typing import Any, Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from atqo import get_lock
+from parquetranger import TableRepo
+from parquetranger.core import EXTENSION, GB_KEY, _render_metadata
+
+from ..utils import gen_rmtree
+from .manifest import MANIFEST_SUFFIX, Manifest, update_manifest
+
+FILTERS_T = Optional[list[tuple[str, str, Any]]]
+
+_OPS = {
+    "=": op.eq,
+    "==": op.eq,
+    "!=": op.ne,
+    "<": op.lt,
+    "<=": op.le,
+    ">": op.gt,
+    ">=": op.ge,
+    "in": lambda left, right: left in right,
+    "not in": lambda left, right: left not in right,
+}
+_EXECUTORS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+_DIST_APIS = {"sync": None, "mp": "process"}
+# atqo scheduling and display options, the pools here batch on their own
+_ATQO_NOOP_KWARGS = {"batch_size", "min_queue_size", "verbose", "pbar"}
+# atqo error tolerance, only its strict default is honoured here
+_ATQO_STRICT_KWARGS = {"raise_errors": True, "allowed_fail_count": 0}
+ARROW_STRINGS = "arrow_strings"
+
+DEFAULT_BATCH_SIZE = 2**16
+DELTA_SUFFIX = ".deltas"
+DELTA_LOG_NAME = "log.json"
+DICTIONARY_INDEX_TYPE = pa.int32()
+STAGING_SUFFIX = ".staging"
+
+
+def _map_arrow_strings(type_: pa.DataType):
+    if pa.types.is_string(type_) or pa.types.is_large_string(type_):
+        return pd.StringDtype("pyarrow")
+
+
+_TYPE_MAPPERS = {
+    None: None,
+    "pyarrow": pd.ArrowDtype,
+    ARROW_STRINGS: _map_arrow_strings,
+}
+
+
+def read_full_df(
+    trepo: TableRepo,
+    columns: Optional[list] = None,
+    filters: FILTERS_T = None,
+    dtype_backend: Optional[str] = None,
+    memory_map: bool = False,
+) -> pd.DataFrame:
+    """dtype_backend="pyarrow" keeps the arrow buffers instead of numpy copies,
+    "arrow_strings" does so only for the string columns"""
+    table = read_full_table(trepo, columns, filters, memory_map)
+    return to_pandas(table, dtype_backend)
+
+
+def read_full_table(
+    trepo: TableRepo,
+    columns: Optional[list] = None,
+    filters: FILTERS_T = None,
+    memory_map: bool = False,
+) -> pa.Table:
+    tables = [*iter_tables(trepo, columns, filters, memory_map)]
+    if tables:
+        return pa.concat_tables(tables)
+    return pa.Table.from_pydict({})
+
+
+def iter_dfs(
+    trepo: TableRepo,
+    columns: Optional[list] = None,
+    filters: FILTERS_T = None,
+    dtype_backend: Optional[str] = None,
+    memory_map: bool = False,
+) -> Iterable[pd.DataFrame]:
+    _to_pandas = partial(to_pandas, dtype_backend=dtype_backend)
+    return map(_to_pandas, iter_tables(trepo, columns, filters, memory_map))
+
+
+def iter_tables(
+    trepo: TableRepo,
+    columns: Optional[list] = None,
+    filters: FILTERS_T = None,
+    memory_map: bool = False,
+) -> Iterable[pa.Table]:
+    """paths are resolved on call, so the env of the trepo can be reset after"""
+    paths = get_matching_paths(trepo, filters)
+    return map(_path_reader(trepo, columns, filters, memory_map), paths)
+
+
+def iter_batches(
+    trepo: TableRepo,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    columns: Optional[list] = None,
+    filters: FILTERS_T = None,
+    memory_map: bool = False,
+) -> Iterable[pa.RecordBatch]:
+    paths = get_matching_paths(trepo, filters)
+    _iter = partial(
+        _iter_path_batches,
+        batch_size=batch_size,
+        columns=columns,
+        filters=filters,
+        memory_map=memory_map,
+        superseded=get_superseded(trepo),
+    )
+    return chain.from_iterable(map(_iter, paths))
+
+
+def map_partitions(
+    trepo: TableRepo,
+    fun,
+    level: Optional[str] = None,
+    workers: Optional[int] = None,
+    executor: str = "thread",
+    columns: Optional[list] = None,
+    filters: FILTERS_T = None,
+    memory_map: bool = False,
+    dtype_backend: Optional[str] = None,
+    dist_api: Optional[str] = None,
+    **atqo_kwargs,
+) -> list:
+    """applies fun to the dataframe of each partition
+
+    with workers set, partitions are fanned out to a thread
+    (for io bound functions) or process (for cpu bound ones) pool,
+    results keep the order of the partitions either way
+
+    partitions are mapped one after the other by default, the atqo style
+    dist_api="mp" maps to a process pool of all cpus, "sync" to no pool,
+    batch_size, min_queue_size, verbose and pbar are accepted and ignored,
+    errors always propagate, so raise_errors and allowed_fail_count
+    can only be given at their strict defaults
+    """
+    _check_atqo_kwargs(atqo_kwargs)
+    if dist_api is not None:
+        if dist_api not in _DIST_APIS:
+            raise ValueError(f"unknown dist_api {dist_api}")
+        executor = _DIST_APIS[dist_api] or executor
+        workers = (workers or os.cpu_count()) if _DIST_APIS[dist_api] else None
+    path_groups = group_paths(trepo, level, filters)
+    _read = _path_reader(trepo, columns, filters, memory_map)
+    _fun = partial(_map_paths, fun=fun, read=_read, dtype_backend=dtype_backend)
+    if not workers:
+        return [*map(_fun, path_groups)]
+    with _EXECUTORS[executor](workers) as pool:
+        return [*pool.map(_fun, path_groups)]
+
+
+def _check_atqo_kwargs(kwargs: dict):
+    for k, v in kwargs.items():
+        if k in _ATQO_NOOP_KWARGS:
+            continue
+        if k not in _ATQO_STRICT_KWARGS:
+            raise TypeError(f"map_partitions got an unexpected argument {k}")
+        if v != _ATQO_STRICT_KWARGS[k]:
+            raise TypeError(
+                f"map_partitions does not support {k}={v}, "
+                "errors of the mapped function always propagate"
+            )
+
+
+def read_head(
+    trepo: TableRepo,
+    n: int = 5,
+    columns: Optional[list] = None,
+    filters: FILTERS_T = None,
+    memory_map: bool = False,
+    dtype_backend: Optional[str] = None,
+) -> pd.DataFrame:
+    """stops reading at the row group where the first n records are reached"""
+    tables, n_left = [], n
+    for batch in iter_batches(trepo, max(n, 1), columns, filters, memory_map):
+        if n_left <= 0:
+            break
+        tables.append(pa.Table.from_batches([batch.slice(0, n_left)]))
+        n_left -= tables[-1].num_rows
+    return to_pandas(_concat(tables), dtype_backend)
+
+
+def read_sample(
+    trepo: TableRepo,
+    n: Optional[int] = None,
+    frac: Optional[float] = None,
+    seed: Optional[int] = None,
+    columns: Optional[list] = None,
+    filters: FILTERS_T = None,
+    memory_map: bool = False,
+    dtype_backend: Optional[str] = None,
+) -> pd.DataFrame:
+    """uniform sample of n records or a frac of the records, without replacement
+
+    n records are picked by position based on the row counts of the manifest,
+    so only the row groups with picked records are read.
+    if filters are given or deltas supersede records, counts are not known,
+    so n is reservoir sampled across all partitions
+    """
+    if (n is None) == (frac is None):
+        raise ValueError("exactly one of n and frac needs to be given")
+    rng = np.random.default_rng(seed)
+    read_args = (columns, filters, memory_map)
+    if frac is not None:
+        batches = iter_batches(trepo, DEFAULT_BATCH_SIZE, *read_args)
+        tables = [_take(b, rng.random(b.num_rows) < frac) for b in batches]
+    elif filters or get_superseded(trepo):
+        tables = _reservoir(iter_batches(trepo, DEFAULT_BATCH_SIZE, *read_args), n, rng)
+    else:
+        tables = _read_positions(trepo, n, rng, columns, memory_map)
+    return to_pandas(_concat(tables), dtype_backend)
+
+
+def read_schema(trepo: TableRepo) -> pa.Schema:
+    """schema of the stored records from a file footer, with partitioning columns"""
+    paths = get_all_paths(trepo)
+    if not paths:
+        return pa.schema([])
+    schema = pq.read_schema(paths[0])
+    for k, v in get_partition_values(paths[0]).items():
+        schema = schema.append(pa.field(k, pa.scalar(v).type))
+    return schema
+
+
+def read_records(
+    trepo: TableRepo,
+    keys,
+    index_cols: list[str],
+    columns: Optional[list] = None,
+    memory_map: bool = False,
+    dtype_backend: Optional[str] = None,
+) -> pd.DataFrame:
+    """records with the given index values, found by filters on the index columns
+
+    files are skipped based on the min/max of the index columns in the manifest
+    and row groups based on their statistics, so only the matching records
+    and the row groups holding them are read
+    """
+    key_index = _to_key_index(keys, index_cols)
+    if key_index.empty:
+        return read_head(trepo, 0, columns, None, memory_map, dtype_backend)
+    filters = [
+        (c, "in", key_index.get_level_values(c).unique().tolist()) for c in index_cols
+    ]
+    df = read_full_df(trepo, columns, filters, dtype_backend, memory_map)
+    if len(index_cols) == 1:
+        return df
+    return df.loc[df.index.isin(key_index), :]
+
+
+def group_paths(
+    trepo: TableRepo, level: Optional[str] = None, filters: FILTERS_T = None
+) -> list[list[Path]]:
+    if trepo.group_cols is None:
+        raise TypeError("only works if group cols is set")
+    gcols = [level] if level else trepo.group_cols
+    groups = {}
+    manifest = load_manifest(trepo)
+    for path in get_matching_paths(trepo, filters):
+        gb_values = _partition_values(path, manifest)
+        groups.setdefault(tuple(gb_values[c] for c in gcols), []).append(path)
+    return [groups[k] for k in sorted(groups.keys())]
+
+
+def get_matching_paths(trepo: TableRepo, filters: FILTERS_T = None) -> list[Path]:
+    """paths of files that can contain records passing the filters
+
+    filters on partitioning columns are evaluated on the partition
+    values stored with the file, the rest on the column statistics
+    of the manifest, without reading any records
+    """
+    paths = get_all_paths(trepo)
+    if not filters:
+        return paths
+    manifest = load_manifest(trepo)
+    out = []
+    for path in paths:
+        entry = manifest.get_entry(path)
+        gb_values = _partition_values(path, manifest)
+        gb_filters = [f for f in filters if f[0] in gb_values]
+        if not _passes(gb_values, gb_filters):
+            continue
+        if (entry is None) or entry.may_pass(_file_filters(filters, gb_values)):
+            out.append(path)
+    return out
+
+
+def get_all_paths(trepo: TableRepo) -> list[Path]:
+    paths = sorted(trepo.paths)
+    if isinstance(trepo, AppendLogRepo):
+        paths += trepo.delta_paths
+    return paths
+
+
+def count_rows(trepo: TableRepo) -> int:
+    """from the manifest, unless records of the base are superseded by deltas"""
+    if get_superseded(trepo):
+        return read_full_table(trepo, columns=[]).num_rows
+    return get_manifest(trepo).rows
+
+
+def load_manifest(trepo: TableRepo) -> Manifest:
+    return Manifest.load(get_manifest_path(trepo), trepo._current_env_parent)
+
+
+def get_manifest(trepo: TableRepo) -> Manifest:
+    """the stored manifest, with the entries of changed files refreshed"""
+    return load_manifest(trepo).refresh(get_all_paths(trepo))
+
+
+def write_manifest(trepo: TableRepo):
+    root = trepo._current_env_parent
+    update_manifest(get_manifest_path(trepo), root, get_all_paths(trepo))
+
+
+def get_manifest_path(trepo: TableRepo) -> Path:
+    return trepo._current_env_parent / f"{trepo.name}{MANIFEST_SUFFIX}"
+
+
+def read_path(
+    path: Path,
+    columns: Optional[list] = None,
+    filters: FILTERS_T = None,
+    memory_map: bool = False,
+    superseded: Optional[dict[Path, pd.Index]] = None,
+) -> pa.Table:
+    """reads the columns of the records passing the filters from one file
+
+    the index columns are always read,
+    partitioning columns are added back from the file metadata
+
+    with memory_map, the file is mapped instead of read into private buffers,
+    so the page cache backing it is shared by the processes reading it
+
+    records with index values in superseded[path] are dropped,
+    as a later delta file holds their new version
+    """
+    gb_values = get_partition_values(path)
+    table = pq.read_table(
+        path,
+        columns=_file_columns(columns, gb_values),
+        filters=_file_filters(filters, gb_values) or None,
+        use_pandas_metadata=True,
+        memory_map=memory_map,
+    )
+    drop_keys = (superseded or {}).get(path, [])
+    if len(drop_keys):
+        table = table.filter(pa.array(~_get_index(table).isin(drop_keys)))
+    return _add_partition_cols(table, gb_values, columns)
+
+
+def get_partition_values(path: Path) -> dict:
+    raw_meta = pq.read_schema(path).metadata or {}
+    raw_gb = raw_meta.get(GB_KEY.encode())
+    return pickle.loads(raw_gb) if raw_gb else {}
+
+
+def get_superseded(trepo: TableRepo) -> dict[Path, pd.Index]:
+    if isinstance(trepo, AppendLogRepo):
+        return trepo.get_superseded()
+    return {}
+
+
+def get_vc_paths(trepo: TableRepo) -> list[Path]:
+    """the manifest is left out, it is a cache rebuilt from the file footers"""
+    if isinstance(trepo, AppendLogRepo):
+        return [trepo.vc_path, trepo.log_dir]
+    return [trepo.vc_path]
+
+
+def to_pandas(table: pa.Table, dtype_backend: Optional[str] = None):
+    """parquet keeps only string columns dictionary encoded,
+    the other categoricals are restored from the pandas metadata"""
+    df = table.to_pandas(types_mapper=_TYPE_MAPPERS[dtype_backend])
+    pd_meta = table.schema.pandas_metadata or {}
+    cat_cols = [
+        c["name"]
+        for c in pd_meta.get("columns", [])
+        if (c["pandas_type"] == "categorical") and (c["name"] in df.columns)
+    ]
+    to_cast = [c for c in cat_cols if not isinstance(df[c].dtype, pd.CategoricalDtype)]
+    if to_cast:
+        df = df.astype({c: "category" for c in to_cast})
+    return df
+
+
+class StoredSchemaRepo(TableRepo):
+    """table repo that casts the written records to the stored schema
+
+    unlike parquetranger, the pandas metadata of the index is kept,
+    and a column that can not be cast raises instead of being written as nulls
+
+    dictionary encoded columns are stored with int32 indices, not the
+    narrowest fitting the categories of the first write
+    """
+
+    def _resolve_metadata(self, df: pd.DataFrame) -> pa.Table:
+        table = pa.Table.from_pandas(df)
+        return _cast_to_stored(table, self._get_full_meta_dict(table.schema))
+
+    def _get_full_meta_dict(self, new_schema: pa.Schema) -> dict:
+        return super()._get_full_meta_dict(_widen_dictionaries(new_schema))
+
+    @contextmanager
+    def stream_writer(self, replace: bool = False):
+        """a function extending the table, for the consecutive writes of a stream
+
+        a single file table is written through one parquet writer
+        to a staging file, starting with the stored row groups unless replacing,
+        and moved in place once the context exits without an error,
+        so the stored records are read once, not at every write
+
+        other layouts are extended file by file, and purged first
+        if replacing, so a failing stream leaves them partly written
+        """
+        if not self._stages_streams:
+            if replace:
+                self.purge()
+            yield self.extend
+            return
+        stream = _FileStream(self, replace)
+        try:
+            yield stream.extend
+        except BaseException:
+            stream.close(commit=False)
+            raise
+        stream.close(commit=True)
+
+    @property
+    def _stages_streams(self) -> bool:
+        return self._is_single_file
+
+    def _gapply(self, gdf: pd.DataFrame, gid_raw, fun, meta_dic):
+        if gdf.empty:
+            return
+        gid = gid_raw if isinstance(gid_raw, tuple) else (gid_raw,)
+        gtrepo = StoredSchemaRepo(
+            Path(self.main_path, *map(str, gid)),
+            max_records=self.max_records,
+            mkdirs=self._remake_dirs,
+            extra_metadata=self.extra_metadata
+            | {GB_KEY: dict(zip(self.group_cols, gid))},
+            drop_group_cols=False,
+            fixed_metadata=meta_dic,
+        )
+        getattr(gtrepo, fun.__name__)(gdf.pipe(self._de_grc))
+
+
+class AppendLogRepo(StoredSchemaRepo):
+    """table repo that writes extensions and replacements as delta files
+
+    writes cost as much as the batch written, the deltas are listed in a log
+    next to the table, and merged on read: a record overrides the records
+    with the same index in the base files and in earlier deltas
+
+    compact writes the merged records to the base files and clears the log
+    """
+
+    def extend(self, df: pd.DataFrame):
+        self._log_delta(df)
+
+    def replace_records(self, df: pd.DataFrame, by_groups=False):
+        self._log_delta(df)
+
+    # deltas are written at the cost of the batch already
+    _stages_streams = False
+
+    def replace_groups(self, df: pd.DataFrame):
+        self.compact()
+        super().replace_groups(df)
+
+    def replace_all(self, df: pd.DataFrame):
+        self.purge()
+        super().extend(df)
+
+    def purge(self):
+        super().purge()
+        gen_rmtree(self.log_dir)
+        self.mkdirs()
+
+    def compact(self):
+        deltas = self.delta_paths
+        if not deltas:
+            return
+        if not self._is_grouped:
+            df = read_full_df(self)
+            TableRepo.purge(self)
+            super().extend(df)
+        else:
+            # a replacement can move a key to another partition,
+            # so base partitions holding superseded keys are rewritten too
+            superseded = self.get_superseded()
+            base_paths = {}
+            for path in self.paths:
+                gb_id = tuple(get_partition_values(path).items())
+                base_paths.setdefault(gb_id, []).append(path)
+                if _read_index(path).isin(superseded.get(path, [])).any():
+                    deltas.append(path)
+            gb_ids = {tuple(get_partition_values(p).items()) for p in deltas}
+            for gb_id in sorted(gb_ids):
+                filters = [(k, "==", v) for k, v in gb_id]
+                gdf = read_full_df(self, filters=filters)
+                if gdf.empty:
+                    for path in base_paths.get(gb_id, []):
+                        path.unlink()
+                    continue
+                super().replace_groups(gdf)
+        gen_rmtree(self.log_dir)
+        self.mkdirs()
+
+    def get_superseded(self) -> dict[Path, pd.Index]:
+        deltas = self.delta_paths
+        delta_keys = [*map(_read_index, deltas)]
+        if not deltas or any(isinstance(k, pd.RangeIndex) for k in delta_keys):
+            return {}
+        out = {}
+        later_keys = delta_keys[-1][:0]
+        for path, keys in zip(deltas[::-1], delta_keys[::-1]):
+            out[path] = later_keys
+            later_keys = later_keys.append(keys).unique()
+        return out | {path: later_keys for path in self.paths}
+
+    def mkdirs(self, force=False):
+        super().mkdirs(force)
+        if self._remake_dirs or force:
+            self.log_dir.mkdir(exist_ok=True, parents=True)
+
+    @property
+    def delta_paths(self) -> list[Path]:
+        return [self.log_dir / rel for rel in self._logged_deltas]
+
+    @property
+    def log_dir(self) -> Path:
+        return self._current_env_parent / f"{self.name}{DELTA_SUFFIX}"
+
+    @property
+    def _log_path(self) -> Path:
+        return self.log_dir / DELTA_LOG_NAME
+
+    @property
+    def _logged_deltas(self) -> list[str]:
+        if not self._log_path.exists():
+            return []
+        return json.loads(self._log_path.read_text())
+
+    def _log_delta(self, df: pd.DataFrame):
+        if not isinstance(df.index, pd.RangeIndex):
+            df = df.loc[~df.index.duplicated(keep="first"), :]
+        with get_lock(f"{self.log_dir} - log"):
+            rels = self._logged_deltas
+            seq_dir = f"{len(set(Path(r).parts[0] for r in rels)):020d}"
+            if self._is_grouped:
+                gb_pairs = [
+                    (k, self._de_grc(g)) for k, g in df.groupby(self.group_cols)
+                ]
+            else:
+                gb_pairs = [((), df)]
+            new_rels = []
+            for gid, gdf in gb_pairs:
+                gid = gid if isinstance(gid, tuple) else (gid,)
+                gb_meta = dict(zip(self.group_cols or [], gid))
+                rel = Path(seq_dir, *map(str, gid))
+                rel = rel.parent / f"{rel.name}{EXTENSION}"
+                self._write_delta(gdf, gb_meta, self.log_dir / rel)
+                new_rels.append(rel.as_posix())
+            tmp_path = self._log_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(rels + new_rels))
+            tmp_path.replace(self._log_path)
+
+    def _write_delta(self, df: pd.DataFrame, gb_meta: dict, path: Path):
+        table = self._resolve_metadata(df)
+        if gb_meta:
+            meta = table.schema.metadata | {GB_KEY.encode(): pickle.dumps(gb_meta)}
+            table = table.replace_schema_metadata(meta)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        pq.write_table(table, path)
+
+
+@dataclass
+class _FileStream:
+    trepo: StoredSchemaRepo
+    replace: bool
+    _writer: Optional[pq.ParquetWriter] = None
+    _full_dict: Optional[dict] = None
+
+    def extend(self, df: pd.DataFrame):
+        table = pa.Table.from_pandas(df)
+        if self._writer is None:
+            self._start(table.schema)
+        self._writer.write_table(_cast_to_stored(table, self._full_dict))
+
+    def close(self, commit: bool):
+        if self._writer is None:
+            if commit and self.replace:
+                self.trepo.purge()
+            return
+        self._writer.close()
+        if commit:
+            self._staging_path.replace(self.trepo._df_path)
+        else:
+            self._staging_path.unlink()
+
+    def _start(self, schema: pa.Schema):
+        path = self.trepo._df_path
+        if self.replace:
+            widened = _widen_dictionaries(schema)
+            self._full_dict = dict(zip(widened.names, widened.types))
+            meta = schema.metadata
+        else:
+            # writes an empty file with the schema if there is none yet
+            self._full_dict = self.trepo._get_full_meta_dict(schema)
+            meta = pq.read_schema(path).metadata or schema.metadata
+        meta = (meta or {}) | _render_metadata(self.trepo.extra_metadata)
+        full_schema = pa.schema(self._full_dict.items(), metadata=meta)
+        self._writer = pq.ParquetWriter(self._staging_path, full_schema)
+        if self.replace:
+            return
+        stored = pq.ParquetFile(path)
+        for i in range(stored.num_row_groups):
+            table = stored.read_row_group(i)
+            self._writer.write_table(_cast_to_stored(table, self._full_dict))
+
+    @property
+    def _staging_path(self) -> Path:
+        path = self.trepo._df_path
+        return path.with_name(f"{path.name}{STAGING_SUFFIX}")
+
+
+def _widen_dictionaries(schema: pa.Schema) -> pa.Schema:
+    fields = [
+        f.with_type(pa.dictionary(DICTIONARY_INDEX_TYPE, f.type.value_type))
+        if pa.types.is_dictionary(f.type)
+        else f
+        for f in schema
+    ]
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def _cast_to_stored(table: pa.Table, full_dict: dict) -> pa.Table:
+    if dict(zip(table.schema.names, table.schema.types)) == full_dict:
+        return table
+    arrs = [
+        table[k].cast(v) if k in table.column_names else pa.nulls(len(table), v)
+        for k, v in full_dict.items()
+    ]
+    schema = pa.schema(full_dict.items(), metadata=table.schema.metadata)
+    return pa.Table.from_arrays(arrs, schema=schema)
+
+
+def _read_positions(trepo: TableRepo, n: int, rng, columns, memory_map):
+    paths = get_all_paths(trepo)
+    manifest = get_manifest(trepo)
+    ends = np.cumsum([manifest.get_entry(p).rows for p in paths], dtype=int)
+    total = ends[-1] if len(ends) else 0
+    picks = np.sort(rng.choice(total, min(n, total), replace=False))
+    tables = []
+    for path_ind in np.unique(np.searchsorted(ends, picks, side="right")):
+        path = paths[path_ind]
+        start = ends[path_ind - 1] if path_ind else 0
+        local_picks = picks[(picks >= start) & (picks < ends[path_ind])] - start
+        table = _read_rows(path, local_picks, columns, memory_map)
+        tables.append(_add_partition_cols(table, get_partition_values(path), columns))
+    return tables
+
+
+def _read_rows(path: Path, positions: np.ndarray, columns, memory_map) -> pa.Table:
+    pfile = pq.ParquetFile(path, memory_map=memory_map)
+    meta = pfile.metadata
+    rg_sizes = np.array(
+        [meta.row_group(i).num_rows for i in range(meta.num_row_groups)]
+    )
+    rg_starts = np.cumsum(rg_sizes) - rg_sizes
+    rg_inds = np.searchsorted(rg_starts, positions, side="right") - 1
+    needed = np.unique(rg_inds)
+    table = pfile.read_row_groups(
+        needed.tolist(),
+        columns=_file_columns(columns, get_partition_values(path)),
+        use_pandas_metadata=True,
+    )
+    read_starts = np.cumsum(rg_sizes[needed]) - rg_sizes[needed]
+    in_read = read_starts[np.searchsorted(needed, rg_inds)]
+    return table.take(pa.array(positions - rg_starts[rg_inds] + in_read))
+
+
+def _reservoir(batches: Iterable[pa.RecordBatch], n: int, rng) -> list[pa.Table]:
+    """keeps the records with the n smallest random keys, a uniform sample"""
+    kept = []
+    for batch in batches:
+        kept.append((pa.Table.from_batches([batch]), rng.random(batch.num_rows)))
+        all_keys = np.concatenate([k for _, k in kept])
+        if all_keys.size > n:
+            cutoff = np.partition(all_keys, n - 1)[n - 1] if n else -1
+            kept = [(_take(t, k <= cutoff), k[k <= cutoff]) for t, k in kept]
+    return [t for t, k in kept if k.size]
+
+
+def _to_key_index(keys, index_cols: list[str]) -> pd.Index:
+    if isinstance(keys, pd.DataFrame):
+        keys = pd.MultiIndex.from_frame(keys.loc[:, index_cols])
+    if isinstance(keys, pd.Index):
+        return keys.set_names(index_cols) if keys.nlevels > 1 else keys
+    if len(index_cols) > 1:
+        return pd.MultiIndex.from_tuples([*keys], names=index_cols)
+    return pd.Index([*keys], name=index_cols[0])
+
+
+def _take(data: Union[pa.Table, pa.RecordBatch], mask: np.ndarray) -> pa.Table:
+    if isinstance(data, pa.RecordBatch):
+        data = pa.Table.from_batches([data])
+    return data.filter(pa.array(mask))
+
+
+def _concat(tables: list[pa.Table]) -> pa.Table:
+    if tables:
+        return pa.concat_tables(tables)
+    return pa.Table.from_pydict({})
+
+
+def _path_reader(trepo: TableRepo, columns, filters, memory_map):
+    return partial(
+        read_path,
+        columns=columns,
+        filters=filters,
+        memory_map=memory_map,
+        superseded=get_superseded(trepo),
+    )
+
+
+def _read_index(path: Path) -> pd.Index:
+    return pq.read_table(path, columns=[], use_pandas_metadata=True).to_pandas().index
+
+
+def _get_index(table: pa.Table) -> pd.Index:
+    ind_meta = table.schema.pandas_metadata["index_columns"]
+    ind_cols = [c for c in ind_meta if isinstance(c, str)]
+    arrs = [table[c].to_numpy() for c in ind_cols]
+    if len(arrs) == 1:
+        return pd.Index(arrs[0])
+    return pd.MultiIndex.from_arrays(arrs)
+
+
+def _iter_path_batches(
+    path: Path, batch_size, columns, filters, memory_map, superseded
+):
+    gb_values = get_partition_values(path)
+    if _file_filters(filters, gb_values) or (path in superseded):
+        table = read_path(path, columns, filters, memory_map, superseded)
+        yield from table.to_batches(batch_size)
+        return
+    batches = pq.ParquetFile(path, memory_map=memory_map).iter_batches(
+        batch_size, columns=_file_columns(columns, gb_values), use_pandas_metadata=True
+    )
+    for batch in batches:
+        yield _add_partition_cols(batch, gb_values, columns)
+
+
+def _partition_values(path: Path, manifest: Manifest) -> dict:
+    entry = manifest.get_entry(path)
+    if (entry is None) or (entry.partition is None):
+        return get_partition_values(path)
+    return entry.partition
+
+
+def _add_partition_cols(data: Union[pa.Table, pa.RecordBatch], gb_values, columns):
+    added = {k: v for k, v in gb_values.items() if (columns is None) or (k in columns)}
+    if not added:
+        return data
+    n = data.num_rows
+    arrs = [*data.columns, *[pa.array(np.repeat(v, n)) for v in added.values()]]
+    names = [*data.schema.names, *added.keys()]
+    return type(data).from_arrays(arrs, names=names, metadata=data.schema.metadata)
+
+
+def _file_columns(columns: Optional[list], gb_values: dict):
+    return columns and [c for c in columns if c not in gb_values]
+
+
+def _file_filters(filters: FILTERS_T, gb_values: dict):
+    return [f for f in filters or [] if f[0] not in gb_values]
+
+
+def _map_paths(paths: list[Path], fun, read, dtype_backend=None):
+    return fun(to_pandas(pa.concat_tables(map(read, paths)), dtype_backend))
+
+
+def _passes(values: dict, filters: list) -> bool:
+    return all(_OPS[f_op](values[col], val) for col, f_op, val in filters)
@@ -12,6 +12,7 @@ VERSION_PREFIX = "zimmer-v0"
 VERSION_SEPARATOR = "/"
 
 RUN_CONF_PATH = Path("__run_conf.yaml")
+RUNTIME_SNAPSHOT_PATH = Path("__runtime_snapshot.json")
 BASE_CONF_PATH = Path("zimmer.yaml")
 USER_CONF_PATH = Path.home() / ".config" / "datazimmer.yaml"
 REQUIREMENTS_FILE = Path("requirements.txt")
@@ -0,0 +1,114 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import Iterable, Optional
+
+from structlog import get_logger
+
+from . import dvc_util as dvcu
+from .exceptions import ProjectSetupException
+from .pipeline_element import PipelineElement
+
+logger = get_logger(ctx="pipeline dag")
+
+
+@dataclass
+class StageNode:
+    name: str
+    namespace: str
+    env: str
+    deps: list[str]
+    outs: list[str]
+    upstream: set[str] = field(default_factory=set)
+
+
+def get_stage_nodes(steps: Iterable[PipelineElement]) -> dict[str, StageNode]:
+    """the stages of the steps in all their write envs, linked as dvc would"""
+    nodes = {}
+    for step in steps:
+        for env in step.write_envs:
+            outs = [*chain(*step.get_all_outs(env))]
+            node = StageNode(
+                step.stage_name(env), step.ns, env, step.get_deps(env), outs
+            )
+            nodes[node.name] = node
+    for node in nodes.values():
+        for other in nodes.values():
+            if (other is not node) and _any_overlap(node.deps, other.outs):
+                node.upstream.add(other.name)
+    return nodes
+
+
+def select_stages(
+    nodes: dict[str, StageNode], targets: Optional[list[str]], changed: Iterable[str]
+) -> set[str]:
+    """the changed stages among the targets and their upstream stages,
+    and every stage downstream of those"""
+    selected = set()
+    to_visit = list(targets or nodes.keys())
+    while to_visit:
+        name = to_visit.pop()
+        if name not in selected:
+            selected.add(name)
+            to_visit.extend(nodes[name].upstream)
+    to_run = set(changed) & selected
+    added = True
+    while added:
+        downstream = {
+            name for name in selected - to_run if nodes[name].upstream & to_run
+        }
+        to_run |= downstream
+        added = bool(downstream)
+    return to_run
+
+
+def run_stages(
+    steps: Iterable[PipelineElement], targets: Optional[list[str]], workers: int
+) -> list[str]:
+    """runs the stages that dvc repro would, in parallel where they are independent
+
+    each stage is recorded in dvc.lock as soon as it finishes,
+    so that the outputs can be pushed the same way as after dvc repro
+    """
+    nodes = get_stage_nodes(steps)
+    # upstream stages of the targets can be in other envs
+    changed = dvcu.status(targets, with_deps=bool(targets)).keys()
+    to_run = select_stages(nodes, targets, changed)
+    logger.info("running stages", stages=sorted(to_run), workers=workers)
+    ran, running = [], {}
+    with ProcessPoolExecutor(workers) as pool:
+        while to_run or running:
+            blocking = to_run | set(running.values())
+            for name in sorted(to_run):
+                if not nodes[name].upstream & blocking:
+                    node = nodes[name]
+                    running[pool.submit(_run_stage, node.namespace, node.env)] = name
+            to_run -= set(running.values())
+            if not running:
+                raise ProjectSetupException(f"circular dependencies in {to_run}")
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                future.result()
+                dvcu.commit([name])
+                ran.append(name)
+                logger.info("stage done", stage=name)
+    return ran
+
+
+def _run_stage(namespace: str, env: str):
+    from .get_runtime import get_runtime
+
+    # parallel stages would overwrite each other in the shared run conf file
+    get_runtime().run_step(namespace, env, dump_conf=False)
+
+
+def _any_overlap(deps: list[str], outs: list[str]) -> bool:
+    return any(_overlaps(dep, out) for dep in deps for out in outs)
+
+
+def _overlaps(path: str, other: str) -> bool:
+    path, other = path.rstrip("/"), other.rstrip("/")
+    return (
+        (path == other) or path.startswith(f"{other}/") or other.startswith(f"{path}/")
+    )
@@ -19,8 +19,8 @@ from .config_loading import (
 from .exceptions import ProjectSetupException
 from .metadata.complete_id import CompleteIdBase
 from .metadata.scrutable import ScruTable
+from .metadata.trepo_io import get_vc_paths
 from .naming import (
-    BASE_CONF_PATH,
     MAIN_MODULE_NAME,
     PROFILES_PATH,
     cli_run,
@@ -63,38 +63,42 @@ class PipelineElement:
     def __call__(self, *args: Any, **kwds: Any) -> Any:
         return self.runner(*args, **kwds)
 
-    def run(self, env):
+    def run(self, env, dump_conf=True):
         conf = RunConfig.load()
         conf.read_env = self.read_env or env
         conf.write_env = env
-        conf.dump()
+        if dump_conf:
+            conf.dump()
+        else:
+            conf.activate()
         _, kwargs = self._get_params(env)
         with _profile(conf.profile, self.stage_name(env)):
             return self.runner(**kwargs)
 
-    def add_stages(self):
+    def get_stages(self):
+        """names and dvc.yaml definitions of the stages of the write envs"""
         from . import typer_commands as tc
 
         # relpath = inspect.getfile(self.runner)
         # lineno = inspect.findsource(self.runner)[1]
 
         for write_env in self.write_envs:
-            _true_read_env = self.read_env or write_env
             _parser = partial(_parse_list, env=write_env)
             param_ids, _ = self._get_params(write_env)
 
-            dvcu.add_stage(
+            yield self.stage_name(write_env), dvcu.get_stage_def(
                 cmd=cli_run((tc.run_step, self.ns, write_env)),
-                name=self.stage_name(write_env),
                 outs_no_cache=_parser(self.outputs_nocache),
                 outs=_parser(self.outputs),
                 outs_persist=_parser(self.outputs_persist),
-                deps=_parse_list([self.runner, *self.dependencies], _true_read_env),
-                params=[
-                    f"{BASE_CONF_PATH.as_posix()}:{pid}" for pid in (param_ids or [])
-                ],
+                deps=self.get_deps(write_env),
+                param_ids=param_ids,
             )
-            yield self.stage_name(write_env)
+
+    def get_deps(self, write_env):
+        return _parse_list(
+            [self.runner, *self.dependencies], self.read_env or write_env
+        )
 
     def get_no_cache_outs(self, env):
         for e in [env] if env else self.write_envs:
@@ -204,7 +208,7 @@ def _parse_elem(elem, env: str) -> str:
         return [elem.env_posix(env)]
     if isinstance(elem, ScruTable):
         with elem.env_ctx(env):
-            return [elem.trepo.vc_path.as_posix()]
+            return [p.as_posix() for p in get_vc_paths(elem.trepo)]
     if isinstance(elem, CompleteIdBase):
         # TODO: bit hacky, means all data from a ns
         return [get_data_path(elem.project, elem.namespace, env).as_posix()]
@@ -1,29 +1,39 @@
 import inspect
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from dataclasses import dataclass
-from functools import partial
+from functools import cached_property, partial
 from importlib import import_module
+from itertools import chain
 from pathlib import Path
 from pkgutil import walk_packages
-from typing import TYPE_CHECKING, TypeVar
+from typing import TYPE_CHECKING, Iterable, Optional, TypeVar, Union
 
 from structlog import get_logger
 
 from .config_loading import Config
 from .dvc_util import import_dvc
-from .exceptions import NotADzObject, ProjectSetupException
+from .exceptions import NotADzObject, ProjectRuntimeException, ProjectSetupException
 from .metadata.atoms import EntityClass
-from .metadata.complete_id import CompleteIdBase
-from .metadata.high_level import NamespaceMetadata, ProjectMetadata
+from .metadata.complete_id import CompleteId, CompleteIdBase
+from .metadata.high_level import (
+    NamespaceMetadata,
+    ProjectMetadata,
+    first_table_of_ec,
+    index_tables_by_ec,
+)
 from .metadata.scrutable import ScruTable
 from .naming import (
     MAIN_MODULE_NAME,
     META_MODULE_NAME,
     VERSION_VAR_NAME,
     get_data_path,
+    get_stage_name,
     to_mod_name,
 )
 from .registry import Registry
+from .runtime_snapshot import RuntimeSnapshot
 from .utils import gen_rmtree
 
 if TYPE_CHECKING:  # pragma: no cover
@@ -43,18 +53,64 @@ class ProjectRuntime:
         self._module_dic = {}
         self._collected_modules = set()
         self._ns_meta_dic: dict[CompleteIdBase, NamespaceMetadata] = {}
-        self.metadata_dic: dict[str, ProjectMetadata] = {
-            self.name: ProjectMetadata(**self.registry.get_info())
-        }
+        self._loaded_namespaces: set[str] = set()
 
         sys.path.insert(0, Path.cwd().as_posix())
+        self.snapshot = RuntimeSnapshot.load_fresh()
+
+    @cached_property
+    def metadata_dic(self) -> dict[str, ProjectMetadata]:
+        """walks all modules of the project the first time it is used"""
+        metadata_dic = {self.name: ProjectMetadata(**self.registry.get_info())}
+        # namespaces loaded alone did not walk the siblings of imported modules
+        self._ns_meta_dic, self._collected_modules = {}, set()
         self._walk_module(import_module(MAIN_MODULE_NAME))
         # self._walk_id(META_MODULE_NAME, True) simpler but bloating
-        while self._module_dic.keys() != self._collected_modules:
-            self._collect_metas()
-        self._fill_projects()
-        self.metadata = self.metadata_dic[self.name]
-        self.data_to_load: list[DataEnvironmentToLoad] = self._get_data_envs()
+        self._collect_all()
+        self._fill_projects(metadata_dic)
+        return metadata_dic
+
+    @property
+    def metadata(self) -> ProjectMetadata:
+        return self.metadata_dic[self.name]
+
+    @cached_property
+    def data_to_load(self) -> list["DataEnvironmentToLoad"]:
+        return self._get_data_envs()
+
+    def get_namespace(self, namespace: str) -> NamespaceMetadata:
+        """metadata of a namespace of the project, importing only
+        the modules of the namespace and the ones its objects come from"""
+        if "metadata_dic" in self.__dict__:
+            return self.metadata.namespaces[namespace]
+        if namespace not in self._loaded_namespaces:
+            mod_name = f"{MAIN_MODULE_NAME}.{namespace}"
+            try:
+                module = import_module(mod_name)
+            except ModuleNotFoundError as e:
+                if e.name != mod_name:
+                    raise
+                raise KeyError(f"no namespace {namespace}")
+            self._walk_module(module, siblings=False)
+            self._collect_all(siblings=False)
+            self._loaded_namespaces.add(namespace)
+        return self._ns_meta_dic[CompleteIdBase(self.name, namespace)]
+
+    @cached_property
+    def _table_indexes(self) -> dict[str, dict[str, list[ScruTable]]]:
+        return {
+            proj_name: index_tables_by_ec(proj.complete.tables)
+            for proj_name, proj in self.metadata_dic.items()
+        }
+
+    @cached_property
+    def _global_table_index(self) -> dict[str, list[ScruTable]]:
+        return index_tables_by_ec(
+            chain(*[proj.complete.tables for proj in self.metadata_dic.values()])
+        )
+
+    def dump_snapshot(self):
+        RuntimeSnapshot.from_runtime(self).dump()
 
     def load_all_data(self, env=None):
         posixes = []
@@ -80,31 +136,46 @@ class ProjectRuntime:
         fixed = base_table.key_map.get(feat_elems)
         if fixed is not None:
             return fixed
+        if self.snapshot is not None:
+            snap_table = self.snapshot.get_fk_table(base_table, feat_elems)
+            if snap_table is not None:
+                return snap_table
         my_proj = self.metadata_dic[base_table.id_.project]
         ns_table = my_proj.namespaces[base_table.id_.namespace].get_table_of_ec(ec)
         if ns_table:
             return ns_table
         _log = partial(logger.warning, table=base_table.id_, feat=feat_elems)
         _log("couldn't find FK source in namespace, looking in project")
-        proj_table = my_proj.table_of_ec(ec)
+        project_index = self._table_indexes[base_table.id_.project]
+        proj_table = first_table_of_ec(project_index, ec)
         if proj_table:
             return proj_table
         _log("couldn't find FK source in project, looking everywhere")
-        for proj in self.metadata_dic.values():
-            ext_tab = proj.table_of_ec(ec)
-            if ext_tab:
-                return ext_tab
+        ext_tab = first_table_of_ec(self._global_table_index, ec)
+        if ext_tab:
+            return ext_tab
         msg = f"couldn't find table for {feat_elems} in {base_table.id_}"
         raise ProjectSetupException(msg)
 
-    def run_step(self, namespace, env):
-        for step in self.metadata.namespaces[namespace].pipeline_elements:
+    def run_step(self, namespace, env, dump_conf=True):
+        if self.snapshot is not None:
+            steps = self.snapshot.namespaces[namespace].get_steps()
+        else:
+            steps = self.get_namespace(namespace).pipeline_elements
+        for step in steps:
             if env in step.write_envs:
-                step.run(env)
+                step.run(env, dump_conf)
                 return
         raise KeyError("no such step")
 
     def step_names_of_env(self, env):
+        if self.snapshot is not None:
+            return [
+                get_stage_name(ns, env)
+                for ns, ns_snap in self.snapshot.namespaces.items()
+                for step in ns_snap.pipeline_elements
+                if env in step.write_envs
+            ]
         steps = self.metadata.complete.pipeline_elements
         return [step.stage_name(env) for step in steps if env in step.write_envs]
 
@@ -122,22 +193,31 @@ class ProjectRuntime:
                     arg_set.add((project_name, meta.uri, ns, data_env, tag))
         return [DataEnvironmentToLoad(*args) for args in arg_set]
 
-    def _walk_module(self, mod):
+    def _walk_module(self, mod, siblings=True):
         self._module_dic[mod.__name__] = mod
-        src_dir = Path(mod.__file__).parent.as_posix()
-        for _info in walk_packages([src_dir], f"{mod.__package__}."):
+        if siblings:
+            paths, prefix = [Path(mod.__file__).parent.as_posix()], mod.__package__
+        elif hasattr(mod, "__path__"):
+            paths, prefix = mod.__path__, mod.__name__
+        else:
+            return
+        for _info in walk_packages(paths, f"{prefix}."):
             _m = import_module(_info.name)
             self._module_dic[_info.name] = _m
 
-    def _collect_metas(self):
+    def _collect_all(self, siblings=True):
+        while self._module_dic.keys() != self._collected_modules:
+            self._collect_metas(siblings)
+
+    def _collect_metas(self, siblings=True):
         # TODO: do this (optionally) for data importing as well
         for ns_module_id, module in list(self._module_dic.items()):
             if ns_module_id in self._collected_modules:
                 continue
-            self._parse_module(module)
+            self._parse_module(module, siblings)
             self._collected_modules.add(ns_module_id)
 
-    def _parse_module(self, module):
+    def _parse_module(self, module, siblings=True):
         try:
             base_id = CompleteIdBase.from_module_name(module.__name__, self.name)
         except NotADzObject:
@@ -148,7 +228,7 @@ class ProjectRuntime:
         ns_meta = self._ns_meta_dic[base_id]
         for obj in map(partial(getattr, module), dir(module)):
             if inspect.ismodule(obj) and _dz_module(obj.__name__):
-                self._walk_module(obj)
+                self._walk_module(obj, siblings)
                 continue
             mod_name = getattr(obj, "__module__", "")  # set for relevant instances
             if _dz_module(mod_name):
@@ -157,16 +237,16 @@ class ProjectRuntime:
                 else:
                     ns_meta.add_obj(obj)
 
-    def _fill_projects(self):
+    def _fill_projects(self, metadata_dic: dict[str, ProjectMetadata]):
         for base_id, ns_meta in self._ns_meta_dic.items():
             proj_id = base_id.project
-            if proj_id not in self.metadata_dic.keys():
+            if proj_id not in metadata_dic.keys():
                 proj_v = _get_v_of_ext_project(proj_id)
                 init_kwargs = self.registry.get_project_meta_base(proj_id, proj_v)
                 if not init_kwargs:
                     continue
-                self.metadata_dic[proj_id] = ProjectMetadata(**init_kwargs)
-            self.metadata_dic[proj_id].namespaces[base_id.namespace] = ns_meta
+                metadata_dic[proj_id] = ProjectMetadata(**init_kwargs)
+            metadata_dic[proj_id].namespaces[base_id.namespace] = ns_meta
 
 
 @dataclass
@@ -192,16 +272,61 @@ class DataEnvironmentToLoad:
 
 
 def dump_dfs_to_tables(
-    df_structable_pairs: list[tuple["pd.DataFrame", "ScruTable"]],
+    df_structable_pairs: list[
+        tuple[Union["pd.DataFrame", Iterable["pd.DataFrame"]], "ScruTable"]
+    ],
     parse=True,
     skip_empty=False,
+    workers: Optional[int] = None,
     **kwargs,
 ):
-    """helper function to fill the detected env of a dataset"""
+    """helper function to fill the detected env of a dataset
+
+    instead of a dataframe, an iterable of dataframes can be given,
+    that is written chunk by chunk, without holding all of it in memory
+
+    with workers, the tables are parsed and written in that many threads,
+    and the failures of all of them are raised together, keyed by table id
+    """
+    _dump = partial(_dump_pairs, parse=parse, skip_empty=skip_empty, **kwargs)
+    if not workers:
+        return _dump(df_structable_pairs)
+    # pairs of the same table are written in order, by the same worker
+    table_pairs: dict[CompleteId, list] = {}
     for df, structable in df_structable_pairs:
-        if skip_empty and df.empty:
+        table_pairs.setdefault(structable.id_, []).append((df, structable))
+    with ThreadPoolExecutor(workers) as pool:
+        futures = {
+            # in a copy of the context, for the active run config
+            id_: pool.submit(copy_context().run, _dump, pairs)
+            for id_, pairs in table_pairs.items()
+        }
+    errors = {k: f.exception() for k, f in futures.items() if f.exception()}
+    if errors:
+        failed = ", ".join(
+            f"{k.namespace}.{k.obj_id}: {e!r}" for k, e in errors.items()
+        )
+        msg = f"failed writing {len(errors)} tables: {failed}"
+        raise ProjectRuntimeException(msg, errors) from next(iter(errors.values()))
+
+
+def _dump_pairs(df_structable_pairs: list, parse, skip_empty, **kwargs):
+    import pandas as pd
+
+    for df, structable in df_structable_pairs:
+        if isinstance(df, pd.DataFrame):
+            if skip_empty and df.empty:
+                continue
+            structable.replace_all(df, parse=parse, **kwargs)
             continue
-        structable.replace_all(df, parse=parse, **kwargs)
+        frames = iter(df)
+        if skip_empty:
+            frames = filter(lambda _df: not _df.empty, frames)
+            first = next(frames, None)
+            if first is None:
+                continue
+            frames = chain([first], frames)
+        structable.replace_all_stream(frames, parse=parse, **kwargs)
 
 
 def _get_v_of_ext_project(project_name):
@@ -0,0 +1,170 @@
+import json
+import sys
+from dataclasses import asdict, dataclass, field
+from hashlib import sha1
+from importlib import import_module
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from structlog import get_logger
+
+from .exceptions import NotADzObject, ProjectSetupException
+from .metadata.complete_id import CompleteIdBase
+from .naming import BASE_CONF_PATH, MAIN_MODULE_NAME, PREFIX_SEP, RUNTIME_SNAPSHOT_PATH
+
+if TYPE_CHECKING:
+    from .metadata.scrutable import ScruTable  # pragma: no cover
+    from .pipeline_element import PipelineElement  # pragma: no cover
+    from .project_runtime import ProjectRuntime  # pragma: no cover
+
+logger = get_logger(ctx="runtime snapshot")
+
+
+@dataclass
+class ObjRef:
+    """where an object of a dz module can be imported from"""
+
+    module: str
+    name: str
+
+    def load(self):
+        return getattr(import_module(self.module), self.name)
+
+    @classmethod
+    def from_obj(cls, obj) -> "ObjRef":
+        module = sys.modules[obj.__module__]
+        for k, v in vars(module).items():
+            if v is obj:
+                return cls(obj.__module__, k)
+        raise NotADzObject(f"{obj} not found in {module}")
+
+
+@dataclass
+class StepSnapshot:
+    ref: ObjRef
+    write_envs: list[str]
+
+
+@dataclass
+class NamespaceSnapshot:
+    modules: list[str] = field(default_factory=list)
+    entity_classes: list[str] = field(default_factory=list)
+    tables: dict[str, ObjRef] = field(default_factory=dict)
+    pipeline_elements: list[StepSnapshot] = field(default_factory=list)
+    # table name -> prefix of the fk columns -> table the fk points to
+    foreign_keys: dict[str, dict[str, ObjRef]] = field(default_factory=dict)
+
+    def get_steps(self) -> list["PipelineElement"]:
+        return [step.ref.load() for step in self.pipeline_elements]
+
+
+@dataclass
+class RuntimeSnapshot:
+    """what the module walk of a ProjectRuntime finds in the project
+
+    written by build-meta, and trusted only while the sources
+    and the config are the same, so that commands can import
+    only the modules they need
+    """
+
+    fingerprint: str
+    project: str
+    namespaces: dict[str, NamespaceSnapshot] = field(default_factory=dict)
+
+    @classmethod
+    def from_runtime(cls, runtime: "ProjectRuntime") -> "RuntimeSnapshot":
+        namespaces = {}
+        for ns_name, ns_meta in runtime.metadata.namespaces.items():
+            ns_snap = NamespaceSnapshot(
+                entity_classes=[ec.name for ec in ns_meta.entity_classes],
+                tables={t.name: ObjRef.from_obj(t) for t in ns_meta.tables},
+                pipeline_elements=[
+                    StepSnapshot(ObjRef.from_obj(pe), pe.write_envs)
+                    for pe in ns_meta.pipeline_elements
+                ],
+                foreign_keys={t.name: _resolve_fks(runtime, t) for t in ns_meta.tables},
+            )
+            namespaces[ns_name] = ns_snap
+        for mod_name in sorted(runtime._module_dic.keys()):
+            try:
+                base_id = CompleteIdBase.from_module_name(mod_name, runtime.name)
+            except NotADzObject:
+                continue
+            if (base_id.project == runtime.name) and base_id.namespace in namespaces:
+                namespaces[base_id.namespace].modules.append(mod_name)
+        return cls(get_fingerprint(), runtime.name, namespaces)
+
+    @classmethod
+    def load_fresh(cls, path: Path = RUNTIME_SNAPSHOT_PATH):
+        """none if there is no snapshot, or the project changed since"""
+        if not path.exists():
+            return
+        raw = json.loads(path.read_text())
+        # snapshots written before the project was stored are stale too
+        if (raw["fingerprint"] != get_fingerprint()) or ("project" not in raw):
+            logger.info("stale snapshot, walking modules")
+            return
+        namespaces = _parse_namespaces(raw["namespaces"])
+        return cls(raw["fingerprint"], raw["project"], namespaces)
+
+    def dump(self, path: Path = RUNTIME_SNAPSHOT_PATH):
+        path.write_text(json.dumps(asdict(self)))
+
+    def get_fk_table(
+        self, base_table: "ScruTable", feat_elems
+    ) -> Optional["ScruTable"]:
+        """none for tables of other projects, only the local one is walked"""
+        if base_table.id_.project != self.project:
+            return
+        ns_snap = self.namespaces.get(base_table.id_.namespace)
+        if ns_snap is None:
+            return
+        ref = ns_snap.foreign_keys.get(base_table.name, {}).get(_fk_key(feat_elems))
+        if ref is not None:
+            return ref.load()
+
+
+def get_fingerprint() -> str:
+    """hash of the sources and the config, reading these is cheap next to importing"""
+    _hash = sha1()
+    src_paths = sorted(Path(MAIN_MODULE_NAME).rglob("*.py"))
+    for path in filter(Path.exists, [BASE_CONF_PATH, *src_paths]):
+        _hash.update(path.as_posix().encode())
+        _hash.update(path.read_bytes())
+    return _hash.hexdigest()
+
+
+def _resolve_fks(runtime: "ProjectRuntime", table: "ScruTable"):
+    plan = table.entity_class.parse_plan
+    out = {}
+    for spec in plan.index_fks + plan.feature_fks:
+        try:
+            target = runtime.get_table_for_entity(spec.target, table, spec.prefix_arr)
+            out[_fk_key(spec.prefix_arr)] = ObjRef.from_obj(target)
+        except (ProjectSetupException, NotADzObject):
+            # resolved and reported at the time it is needed
+            continue
+    return out
+
+
+def _fk_key(feat_elems) -> str:
+    return PREFIX_SEP.join(feat_elems)
+
+
+def _parse_namespaces(raw: dict) -> dict[str, NamespaceSnapshot]:
+    out = {}
+    for ns_name, ns_dic in raw.items():
+        out[ns_name] = NamespaceSnapshot(
+            modules=ns_dic["modules"],
+            entity_classes=ns_dic["entity_classes"],
+            tables={k: ObjRef(**v) for k, v in ns_dic["tables"].items()},
+            pipeline_elements=[
+                StepSnapshot(ObjRef(**s["ref"]), s["write_envs"])
+                for s in ns_dic["pipeline_elements"]
+            ],
+            foreign_keys={
+                t: {k: ObjRef(**v) for k, v in fks.items()}
+                for t, fks in ns_dic["foreign_keys"].items()
+            },
+        )
+    return out
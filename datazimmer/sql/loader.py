@@ -1,6 +1,6 @@
 from contextlib import contextmanager
 from dataclasses import dataclass
-from functools import partial
+from itertools import islice
 from pathlib import Path
 from typing import TYPE_CHECKING, List
 
@@ -12,8 +12,9 @@ from structlog import get_logger
 
 from ..config_loading import RunConfig
 from ..get_runtime import get_runtime
-from ..metadata.atoms import EntityClass, feats_to_cols, to_sa_col
+from ..metadata.atoms import ForeignKeySpec, to_sa_col
 from ..metadata.high_level import NamespaceMetadata
+from ..metadata.manifest import Manifest
 from ..metadata.scrutable import ScruTable
 from ..utils import is_postgres
 
@@ -114,16 +115,21 @@ class NamespaceMapper:
 
     def _load_table(self, table: ScruTable, session):
         ins = self.sql_meta.tables[table.id_.sql_id].insert()
-        logger.info("loading", table=table.id_.sql_id)
-        for df in table.dfs:
+        manifest = table.get_manifest()
+        logger.info("loading", table=table.id_.sql_id, rows=manifest.rows)
+        if manifest.rows == 0:
+            return
+        dfs = table.iter_dfs()
+        for n_files in _plan_batches(manifest, self.batch_size):
+            df = pd.concat([*islice(dfs, n_files)])
             self._partition(df.reset_index() if table.index else df, ins, session)
 
     def _validate_table(self, table: ScruTable):
-        dt_map = {}
+        dt_map = table.dtype_map
         table_id = table.id_.sql_id
         logger.info("validating table", table=table_id)
-        if not is_postgres(self.engine):
-            dt_map = table.dtype_map
+        if is_postgres(self.engine):
+            dt_map = {k: v for k, v in dt_map.items() if _not_read_back(v)}
         df_sql = pd.read_sql(f"SELECT * FROM {table_id}", con=self.engine).astype(
             dt_map
         )
@@ -155,9 +161,14 @@ class SqlTableConverter:
         self._table = scrutable
         self._mapper = parent_mapper
         self._sql_id = scrutable.id_.sql_id
-        self.fk_constraints = []
-        self.ind_cols = self._get_sa_cols(scrutable.index, True)
-        self.feat_cols = self._get_sa_cols(scrutable.features, False)
+        plan = scrutable.entity_class.parse_plan
+        self.ind_cols = [to_sa_col(c, pk=True) for c in plan.index_columns]
+        self.feat_cols = [to_sa_col(c) for c in plan.feature_columns]
+        sa_cols = {c.name: c for c in self.ind_cols + self.feat_cols}
+        self.fk_constraints = [
+            self._get_fk([sa_cols[c] for c in spec.columns], spec)
+            for spec in plan.index_fks + plan.feature_fks
+        ]
 
     def create(self):
         sa.Table(
@@ -166,16 +177,11 @@ class SqlTableConverter:
             *self._schema_items,
         )
 
-    def _add_fk(
-        self,
-        sql_cols: List[sa.Column],
-        entity: EntityClass,
-        prefix_arr,
-    ):
+    def _get_fk(self, sql_cols: List[sa.Column], spec: ForeignKeySpec):
         target_table = self._mapper.runtime.get_table_for_entity(
-            entity, self._table, prefix_arr
+            spec.target, self._table, spec.prefix_arr
         )
-        pref_str = PREFIX_SEP.join(prefix_arr) + PREFIX_SEP
+        pref_str = PREFIX_SEP.join(spec.prefix_arr) + PREFIX_SEP
         matching_cols = [
             c.name.replace(pref_str, f"{target_table.id_.sql_id}.") for c in sql_cols
         ]
@@ -183,16 +189,12 @@ class SqlTableConverter:
         if is_postgres(self._mapper.engine):
             defer_kws["initially"] = "DEFERRED"
 
-        fk = sa.ForeignKeyConstraint(
+        return sa.ForeignKeyConstraint(
             sql_cols,
             matching_cols,
             name=f"_{self._sql_id}_{pref_str}_fk",
             **defer_kws,
         )
-        self.fk_constraints.append(fk)
-
-    def _get_sa_cols(self, feats, pk):
-        return feats_to_cols(feats, self._add_fk, partial(to_sa_col, pk=pk))
 
     @property
     def _schema_items(self):
@@ -216,5 +218,26 @@ def tmp_constr(v=False):
         sqlpath.unlink()
 
 
+def _plan_batches(manifest: Manifest, batch_size: int):
+    """numbers of consecutive files to insert together, small files are merged"""
+    n_files, n_rows = 0, 0
+    for entry in manifest.files.values():
+        if n_files and (n_rows + entry.rows > batch_size):
+            yield n_files
+            n_files, n_rows = 0, 0
+        n_files += 1
+        n_rows += entry.rows
+    if n_files:
+        yield n_files
+
+
+def _not_read_back(dtype) -> bool:
+    """dtypes read_sql does not return even from a typed database"""
+    pd_dtype = pd.api.types.pandas_dtype(dtype)
+    if isinstance(pd_dtype, pd.api.extensions.ExtensionDtype):
+        return True
+    return (pd_dtype.kind in "if") and (pd_dtype.itemsize < 8)
+
+
 def _parse_d(d):
     return {k: None if pd.isna(v) else v for k, v in d.items()}
@@ -3,9 +3,11 @@ from pathlib import Path
 import pytest
 
 import datazimmer.typer_commands as tc
+from datazimmer import dvc_util as dvcu
 from datazimmer.exceptions import ProjectSetupException
 from datazimmer.naming import DATA_PATH, DEFAULT_ENV_NAME, MAIN_MODULE_NAME
 from datazimmer.typer_commands import _validate_empty_vc
+from datazimmer.utils import cd_into
 
 from .util import run_in_process
 
@@ -25,3 +27,21 @@ def test_vc_validation(in_template, proper_env):
     Path(MAIN_MODULE_NAME, "other.py").write_text("a = 10")
     with pytest.raises(ProjectSetupException):
         _validate_empty_vc("err")
+
+
+def test_write_stages(tmp_path):
+    with cd_into(tmp_path):
+        dvcu.run_dvc("init", "--no-scm")
+        Path("zimmer.yaml").write_text("envs: {a: {x: 1}}")
+        s1 = dvcu.get_stage_def(
+            "echo 1", ["o2"], ["o1"], ["o3"], ["zimmer.yaml"], ["envs.a.x"]
+        )
+        s2 = dvcu.get_stage_def("echo 2", [], [], [], ["o1"], [])
+        dvcu.write_stages({"s1": s1, "s2": s2})
+        assert dvcu.run_dvc("stage", "list", "--name-only").split() == ["s1", "s2"]
+        assert dvcu.list_stages() == ["s1", "s2"]
+        mtime = dvcu.DVC_YAML_PATH.stat().st_mtime_ns
+        dvcu.write_stages({"s1": s1, "s2": s2})
+        assert dvcu.DVC_YAML_PATH.stat().st_mtime_ns == mtime
+        dvcu.write_stages({"s2": s2})
+        assert dvcu.list_stages() == ["s2"]
@@ -1,7 +1,12 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
 import pytest
 
-from datazimmer.config_loading import Config
+from datazimmer import config_loading
+from datazimmer.config_loading import Config, RunConfig
 from datazimmer.exceptions import ProjectSetupException
+from datazimmer.naming import BASE_CONF_PATH, RUN_CONF_PATH
 
 
 def test_missing_config():
@@ -14,3 +19,44 @@ def test_project_config(in_template):
 
     with pytest.raises(KeyError):
         conf.get_env("nothing")
+
+
+def test_config_cache(in_template, monkeypatch):
+    calls = []
+    _parse = config_loading._yaml_or_err
+    monkeypatch.setattr(
+        config_loading, "_yaml_or_err", lambda *a: calls.append(a) or _parse(*a)
+    )
+    conf = Config.load()
+    conf.get_aswan_spec("new-aswan")
+    assert Config.load() == Config.load() != conf
+    conf_str = BASE_CONF_PATH.read_text()
+    cached_calls = len(calls)
+    assert cached_calls <= 1
+
+    conf.dump()
+    assert Config.load() == conf
+    assert len(calls) == cached_calls + 1
+    BASE_CONF_PATH.write_text(conf_str + "\ncron: 0 0 * * *\n")
+    assert Config.load().cron == "0 0 * * *"
+    BASE_CONF_PATH.write_text(conf_str)
+    assert Config.load().cron == ""
+
+
+def test_active_run_config(in_template):
+    with RunConfig(write_env="outer"):
+        RUN_CONF_PATH.unlink()
+        assert RunConfig.load().write_env == "outer"
+        with RunConfig(write_env="inner", profile=True):
+            assert RUN_CONF_PATH.exists()
+            inner_conf = RunConfig.load()
+            inner_conf.write_env = "changed"
+            assert RunConfig.load() == RunConfig(write_env="inner", profile=True)
+            with ThreadPoolExecutor(1) as pool:
+                assert pool.submit(RunConfig.load).result().write_env == "inner"
+                RUN_CONF_PATH.unlink()
+                run = copy_context().run
+                assert pool.submit(run, RunConfig.load).result().profile
+        assert RunConfig.load().write_env == "outer"
+    with pytest.raises(ProjectSetupException):
+        RunConfig.load()
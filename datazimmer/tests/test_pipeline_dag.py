@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+import yaml
+
+import datazimmer.typer_commands as tc
+from datazimmer import dvc_util as dvcu
+from datazimmer import pipeline_dag
+from datazimmer.config_loading import RunConfig
+from datazimmer.naming import DATA_PATH, DEFAULT_ENV_NAME, RUN_CONF_PATH
+from datazimmer.pipeline_dag import StageNode, run_stages, select_stages
+
+from .util import run_in_process
+
+
+def test_select_stages():
+    nodes = {
+        "a": StageNode("a", "ns", "e", ["src/a.py"], ["data/a"]),
+        "b": StageNode("b", "ns", "e", ["data/a/x"], ["data/b"], {"a"}),
+        "c": StageNode("c", "ns", "e", ["data/b"], ["data/c"], {"b"}),
+        "d": StageNode("d", "ns", "e", ["src/d.py"], ["data/d"]),
+    }
+    assert select_stages(nodes, None, ["a"]) == {"a", "b", "c"}
+    assert select_stages(nodes, ["b"], ["a", "d"]) == {"a", "b"}
+    assert select_stages(nodes, ["c", "d"], ["b", "d"]) == {"b", "c", "d"}
+    assert select_stages(nodes, None, []) == set()
+
+
+def test_upstream_in_other_env(monkeypatch):
+    nodes = {
+        "e1-a": StageNode("e1-a", "ns", "e1", ["src/a.py"], ["data/a/e1"]),
+        "e2-b": StageNode("e2-b", "ns", "e2", ["data/a/e1"], ["data/b"], {"e1-a"}),
+    }
+
+    def _status(targets, with_deps=False):
+        # dvc status only reports the targets without --with-deps
+        return {"e1-a": []} if with_deps or not targets else {}
+
+    ran = []
+    monkeypatch.setattr(pipeline_dag, "get_stage_nodes", lambda steps: nodes)
+    monkeypatch.setattr(pipeline_dag, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(pipeline_dag, "_run_stage", lambda ns, env: ran.append(env))
+    monkeypatch.setattr(dvcu, "status", _status)
+    monkeypatch.setattr(dvcu, "commit", lambda targets: None)
+    assert run_stages([], ["e2-b"], 2) == ["e1-a", "e2-b"]
+    assert ran == ["e1", "e2"]
+
+
+def test_native_run(in_template, proper_env):
+    run_in_process(tc.build_meta)
+    run_in_process(tc.run, workers=2)
+    assert (DATA_PATH / "test-project" / "core" / DEFAULT_ENV_NAME).exists()
+    locked = yaml.safe_load(open("dvc.lock"))["stages"]
+    assert locked[f"{DEFAULT_ENV_NAME}-core"]["deps"]
+    assert not dvcu.status(None)
+
+
+def test_stage_conf_not_dumped(in_template, monkeypatch):
+    from src.core import proc
+
+    confs = []
+
+    def _step():
+        confs.append(RunConfig.load())
+
+    _step.__module__ = proc.runner.__module__
+    monkeypatch.setattr(proc, "runner", _step)
+    with RunConfig():
+        copy_context().run(proc.run, DEFAULT_ENV_NAME, dump_conf=False)
+        assert yaml.safe_load(RUN_CONF_PATH.read_text())["write_env"] is None
+        assert RunConfig.load().write_env is None
+    assert confs[0].write_env == DEFAULT_ENV_NAME
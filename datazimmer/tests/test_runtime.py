@@ -1,6 +1,21 @@
+import inspect
+import sys
+import time
+from importlib import import_module
+from pathlib import Path
+from types import SimpleNamespace
+
 import pytest
 
+from datazimmer.exceptions import ProjectSetupException
 from datazimmer.get_runtime import get_runtime
+from datazimmer.metadata.atoms import EntityClass
+from datazimmer.naming import (
+    BASE_CONF_PATH,
+    DEFAULT_ENV_NAME,
+    MAIN_MODULE_NAME,
+    RUNTIME_SNAPSHOT_PATH,
+)
 
 
 def test_runtime_basics(running_template):
@@ -10,3 +25,122 @@ def test_runtime_basics(running_template):
 
     with pytest.raises(KeyError):
         runtime.run_step("core", "no-env")
+
+
+def test_runtime_snapshot(in_template):
+    from datazimmer.project_runtime import ProjectRuntime
+
+    full_runtime = ProjectRuntime()
+    full_runtime.dump_snapshot()
+    runtime = ProjectRuntime()
+    assert runtime.snapshot is not None
+    assert "metadata_dic" not in runtime.__dict__
+    assert runtime.step_names_of_env(DEFAULT_ENV_NAME) == (
+        full_runtime.step_names_of_env(DEFAULT_ENV_NAME)
+    )
+
+    from src.core import Thang, scrutable, thang_table
+
+    assert runtime.snapshot.namespaces["core"].tables["thang"].load() is thang_table
+    ec = EntityClass.from_cls(Thang)
+    fk_spec = ec.parse_plan.feature_fks[-1]
+    fk_table = runtime.get_table_for_entity(
+        fk_spec.target, thang_table, fk_spec.prefix_arr
+    )
+    assert fk_table is scrutable
+    assert "metadata_dic" not in runtime.__dict__
+    other_id = SimpleNamespace(project="other-project", namespace="core")
+    other_table = SimpleNamespace(id_=other_id, name=thang_table.name)
+    assert runtime.snapshot.get_fk_table(other_table, fk_spec.prefix_arr) is None
+    with pytest.raises(KeyError):
+        runtime.run_step("core", "no-env")
+
+    conf_str = BASE_CONF_PATH.read_text()
+    BASE_CONF_PATH.write_text(conf_str + "\n")
+    assert ProjectRuntime().snapshot is None
+    BASE_CONF_PATH.write_text(conf_str)
+    RUNTIME_SNAPSHOT_PATH.unlink()
+
+
+def test_lazy_namespaces(in_template):
+    from datazimmer.project_runtime import ProjectRuntime
+
+    other_path = Path(MAIN_MODULE_NAME, "other.py")
+    other_path.write_text("raise ImportError('other namespace imported')\n")
+    try:
+        runtime = ProjectRuntime()
+        assert runtime.snapshot is None
+        core_ns = runtime.get_namespace("core")
+        assert f"{MAIN_MODULE_NAME}.other" not in sys.modules
+        assert "thang" in [t.name for t in core_ns.tables]
+        assert [pe.ns for pe in core_ns.pipeline_elements] == ["core"]
+        with pytest.raises(KeyError):
+            runtime.get_namespace("nonexistent")
+        with pytest.raises(ImportError):
+            runtime.metadata_dic
+    finally:
+        other_path.unlink()
+
+
+def test_table_index(in_template):
+    from datazimmer.project_runtime import ProjectRuntime
+
+    runtime = ProjectRuntime()
+    core_ns = runtime.metadata.namespaces["core"]
+    for table in core_ns.tables:
+        assert core_ns.get_table_of_ec(table.entity_class) is table
+        assert runtime.metadata.table_of_ec(table.entity_class) is table
+    assert runtime._global_table_index.keys() == core_ns._tables_by_ec.keys()
+    orphan_ec = EntityClass("Orphan")
+    assert core_ns.get_table_of_ec(orphan_ec) is None
+    with pytest.raises(ProjectSetupException):
+        runtime.get_table_for_entity(orphan_ec, core_ns.tables[0], ("x",))
+
+
+def test_creation_module(in_template):
+    module, _ = _import_wide(3)
+    for i in range(3):
+        assert getattr(module, f"wide_table_{i}").__module__ == module.__name__
+
+
+def test_wide_namespace_import(in_template, monkeypatch, pytestconfig):
+    """import time by table of a namespace of 500 tables
+
+    compared to looking up the stack, timed on 50 tables to keep the test fast
+    """
+    if not pytestconfig.getoption("benchmark"):
+        pytest.skip("timing benchmark, run with --benchmark")
+    from datazimmer.metadata import scrutable as scrutable_module
+
+    _, frame_time = _import_wide(500)
+    monkeypatch.setattr(
+        scrutable_module, "get_creation_module_name", _stack_creation_module_name
+    )
+    _, stack_time = _import_wide(50)
+    assert frame_time < stack_time
+
+
+def _import_wide(n_tables: int):
+    """the module of a namespace with n tables, and its import time by table"""
+    mod_name = f"{MAIN_MODULE_NAME}.wide"
+    wide_path = Path(MAIN_MODULE_NAME, "wide.py")
+    lines = ["import datazimmer as dz"]
+    for i in range(n_tables):
+        lines += [
+            f"class Wide{i}(dz.AbstractEntity):",
+            "    x = int",
+            f"wide_table_{i} = dz.ScruTable(Wide{i})",
+        ]
+    wide_path.write_text("\n".join(lines))
+    try:
+        start = time.perf_counter()
+        module = import_module(mod_name)
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.modules.pop(mod_name)
+        wide_path.unlink()
+    return module, elapsed / n_tables
+
+
+def _stack_creation_module_name():
+    return inspect.getmodule(inspect.stack()[2][0]).__name__
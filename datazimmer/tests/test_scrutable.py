@@ -1,10 +1,28 @@
+from copy import copy
+from dataclasses import replace
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytest
 
+import datazimmer as dz
 from datazimmer import ScruTable
 from datazimmer.config_loading import RunConfig
-from datazimmer.exceptions import ProjectSetupException
+from datazimmer.exceptions import (
+    DataConstraintException,
+    ProjectRuntimeException,
+    ProjectSetupException,
+)
 from datazimmer.get_runtime import get_runtime
+from datazimmer.metadata import atoms
+from datazimmer.metadata.atoms import EntityClass, parse_df
+from datazimmer.metadata.trepo_io import (
+    StoredSchemaRepo,
+    get_manifest_path,
+    get_vc_paths,
+)
 from datazimmer.naming import DEFAULT_ENV_NAME
 from datazimmer.sql.loader import SqlLoader, tmp_constr
 
@@ -42,6 +60,475 @@ def test_scrutable_parsing(running_template):
     assert "thing" in scrutable.__repr__()
 
 
+def test_parse_plan(running_template):
+    from src.core import Event, event_table
+
+    plan = event_table.parse_plan
+    assert plan is EntityClass.from_cls(Event).parse_plan
+    assert plan.index_cols == [Event.eid]
+    assert plan.full_dt_map == event_table.dtype_map
+    assert not plan.index_fks + plan.feature_fks
+
+
+def test_parse_df_fast_path(running_template):
+    from src.core import Event
+
+    raw_df = pd.DataFrame({"eid": [2, 1], "kind": ["a", "b"], "value": [1, 2]})
+    parsed = parse_df(raw_df, Event)
+    assert parsed[Event.value].dtype == float
+    assert parsed.index.name == Event.eid
+
+    same = parse_df(parsed, Event, copy=False)
+    assert same.index is parsed.index
+    assert np.shares_memory(same[Event.value].values, parsed[Event.value].values)
+    reordered = parsed.loc[:, [Event.value, Event.kind]]
+    out = parse_df(reordered, Event, copy=False)
+    assert out.columns.tolist() == parsed.columns.tolist()
+    assert np.shares_memory(out[Event.value].values, reordered[Event.value].values)
+    copied = parse_df(parsed, Event)
+    assert not np.shares_memory(copied[Event.value].values, parsed[Event.value].values)
+    pd.testing.assert_frame_equal(copied, parsed)
+
+
+def test_parse_checks(running_template, monkeypatch):
+    from src.core import Event, event_table
+
+    event_table: ScruTable
+    df = pd.DataFrame(
+        {
+            Event.eid: [1, 1, 2, 3],
+            Event.kind: ["a", "b", None, "c"],
+            Event.value: [1.0, None, 2.0, -1.0],
+        }
+    )
+    with pytest.raises(DataConstraintException) as exc_info:
+        parse_df(df, Event, domains={Event.kind: ["a", "b"], Event.value: _positive})
+    violations = exc_info.value.violations
+    assert violations["duplicate index"].index.tolist() == [1, 1]
+    assert violations[f"null {Event.kind}"].index.tolist() == [2]
+    assert violations[f"domain {Event.kind}"].index.tolist() == [3]
+    assert violations[f"domain {Event.value}"].index.tolist() == [3]
+    assert parse_df(df, Event, check=False).shape[0] == 4
+    with pytest.raises(DataConstraintException):
+        event_table.replace_all(df)
+
+    monkeypatch.setattr(atoms, "CHECK_FULL_ROWS", 2)
+    monkeypatch.setattr(atoms, "CHECK_SAMPLE_ROWS", 2)
+    sampled = df.drop(2).assign(kind="a")
+    assert parse_df(sampled, Event).shape[0] == 3
+    with pytest.raises(DataConstraintException):
+        parse_df(sampled, Event, check=True)
+
+
+def _positive(s: pd.Series):
+    return s > 0
+
+
+def test_category(running_template):
+    from src.core import Reading, reading_table
+
+    reading_table: ScruTable
+    df = pd.DataFrame(
+        {
+            Reading.rid: [1, 2, 3],
+            Reading.status: ["on", "off", "on"],
+            Reading.note: [None, "x", "x"],
+            Reading.level: ["1", "2", "1"],
+        }
+    )
+    reading_table.replace_all(df)
+    out = reading_table.get_full_df()
+    assert isinstance(out[Reading.status].dtype, pd.CategoricalDtype)
+    assert out[Reading.note].isna().sum() == 1
+    assert out[Reading.level].cat.categories.tolist() == [1, 2]
+    schema = reading_table.peek_schema()
+    assert pa.types.is_dictionary(schema.field(Reading.status).type)
+    pd.testing.assert_frame_equal(parse_df(out, Reading), out)
+    str_levels = out.assign(**{Reading.level: out[Reading.level].astype(str)})
+    assert parse_df(str_levels, Reading)[Reading.level].cat.categories.dtype == int
+
+    # more categories than the dictionary indices of the first write fit
+    n = 200
+    reading_table.extend(
+        pd.DataFrame(
+            {
+                Reading.rid: range(10, 10 + n),
+                Reading.status: [f"s{i}" for i in range(n)],
+                Reading.note: None,
+                Reading.level: range(n),
+            }
+        )
+    )
+    out = reading_table.get_full_df()
+    assert out[Reading.status].notna().all()
+    assert out[Reading.status].nunique() == n + 2
+    assert out[Reading.level].nunique() == n
+    reading_table.purge()
+
+
+def test_arrow_strings(running_template):
+    from src.core import Note, note_table
+
+    note_table: ScruTable
+    note_table.replace_all(
+        pd.DataFrame({Note.text: ["x", "y"], Note.author: ["a", None]})
+    )
+    arrow_str = pd.StringDtype("pyarrow")
+    out = note_table.get_full_df()
+    assert (out.dtypes == arrow_str).all()
+    assert out[Note.author].isna().tolist() == [False, True]
+    assert (note_table.head(1).dtypes == arrow_str).all()
+    assert (parse_df(out, Note, arrow_strings=True).dtypes == arrow_str).all()
+    assert parse_df(out, Note)[Note.text].dtype == object
+    note_table.purge()
+
+
+def test_compact_dtypes(running_template):
+    from src.core import Measurement, measurement_table
+
+    measurement_table: ScruTable
+    df = pd.DataFrame(
+        {
+            Measurement.mid: [0, 1, 2],
+            Measurement.level: [1, 2, 3],
+            Measurement.value: [0.5, 1.5, 2.5],
+            Measurement.count: [1, None, 2**40],
+            Measurement.flag: [True, None, False],
+        }
+    )
+    measurement_table.replace_all(df)
+    out = measurement_table.get_full_df()
+    assert out.index.dtype == np.int32
+    assert out.dtypes.to_dict() == {
+        Measurement.level: np.int16,
+        Measurement.value: np.float32,
+        Measurement.count: pd.Int64Dtype(),
+        Measurement.flag: pd.BooleanDtype(),
+    }
+    assert out[Measurement.count].tolist() == [1, pd.NA, 2**40]
+    schema = measurement_table.peek_schema()
+    assert schema.field(Measurement.level).type == pa.int16()
+    pd.testing.assert_frame_equal(parse_df(out, Measurement), out)
+    measurement_table.purge()
+
+
+def test_scrutable_pushdown(running_template):
+    df = pd.DataFrame(
+        {
+            "ind": [1, 2, 3, 4],
+            "d": ["2020-01-01"] * 4,
+            "num": [1.0, 2.0, 3.0, 4.0],
+            "c": ["A", "B", "A", "B"],
+        }
+    )
+
+    from src.core import Thing, scrutable
+
+    scrutable: ScruTable
+    scrutable.replace_all(df)
+
+    proj_df = scrutable.get_full_df(columns=[Thing.num])
+    assert proj_df.columns.tolist() == [Thing.num]
+    assert proj_df.index.name == Thing.ind
+
+    filt_df = scrutable.get_full_df(
+        columns=[Thing.c], filters=[(Thing.c, "==", "B"), (Thing.num, ">", 2)]
+    )
+    assert filt_df.to_dict() == {Thing.c: {4: "B"}}
+
+    query = scrutable.query().select(Thing.d).where(Thing.ind, "in", [1, 2])
+    assert sorted(query.get_full_df().index) == [1, 2]
+    assert sum(map(len, query.iter_dfs())) == 2
+    assert scrutable.query(filters=[(Thing.c, "==", "X")]).get_full_df().empty
+
+    arrow_table = scrutable.get_full_arrow(columns=[Thing.c])
+    assert arrow_table.column_names == [Thing.ind, Thing.c]
+    batches = [
+        *scrutable.iter_arrow_batches(batch_size=1, filters=[(Thing.num, "<", 3)])
+    ]
+    assert [b.num_rows for b in batches] == [1, 1]
+    arrow_df = scrutable.get_full_df(dtype_backend="pyarrow")
+    assert isinstance(arrow_df[Thing.c].dtype, pd.ArrowDtype)
+    pd.testing.assert_frame_equal(
+        scrutable.get_full_df(memory_map=True), scrutable.get_full_df()
+    )
+
+    assert scrutable.map_partitions(fun=len) == [2, 2]
+    for executor in ["thread", "process"]:
+        assert scrutable.map_partitions(fun=len, workers=2, executor=executor) == [2, 2]
+    for dist_api in ["sync", "mp"]:
+        assert scrutable.map_partitions(fun=len, dist_api=dist_api) == [2, 2]
+    with pytest.raises(ValueError):
+        scrutable.map_partitions(fun=len, dist_api="ray")
+    atqo_kwargs = dict(batch_size=4, pbar=True, verbose=True, raise_errors=True)
+    assert scrutable.map_partitions(fun=len, dist_api="mp", **atqo_kwargs) == [2, 2]
+    for bad_kwargs in [{"raise_errors": False}, {"allowed_fail_count": 2}, {"x": 1}]:
+        with pytest.raises(TypeError):
+            scrutable.map_partitions(fun=len, **bad_kwargs)
+    scrutable.purge()
+
+
+def test_append_log(running_template):
+    from src.core import Event, event_table
+
+    event_table: ScruTable
+    base_df = pd.DataFrame(
+        {"eid": [1, 2, 3], "kind": ["a", "b", "a"], "value": [1.0, 2.0, 3.0]}
+    )
+    event_table.replace_all(base_df)
+    event_table.extend(pd.DataFrame({"eid": [4], "kind": ["b"], "value": [4.0]}))
+    event_table.replace_records(
+        pd.DataFrame({"eid": [1, 4], "kind": ["a", "b"], "value": [10.0, 40.0]})
+    )
+    assert sum(1 for _ in event_table.paths) == 2
+
+    merged = event_table.get_full_df().sort_index()
+    assert merged[Event.value].tolist() == [10.0, 2.0, 3.0, 40.0]
+    big_df = event_table.get_full_df(filters=[(Event.value, ">", 5)])
+    assert sorted(big_df.index) == [1, 4]
+    assert sorted(event_table.map_partitions(fun=len)) == [2, 2]
+
+    assert len(event_table) == 4
+    event_table.compact()
+    compacted = event_table.get_full_df().sort_index()
+    pd.testing.assert_frame_equal(compacted.loc[:, merged.columns], merged)
+
+    # keys moving to another partition, leaving one empty
+    event_table.replace_all(base_df.iloc[:2, :])
+    event_table.replace_records(
+        pd.DataFrame({"eid": [1], "kind": ["b"], "value": [1.0]})
+    )
+    event_table.compact()
+    compacted = event_table.get_full_df().sort_index()
+    assert compacted.index.tolist() == [1, 2]
+    assert compacted[Event.kind].tolist() == ["b", "b"]
+    event_table.replace_records(
+        pd.DataFrame({"eid": [1, 2], "kind": ["c", "c"], "value": [1.0, 2.0]})
+    )
+    event_table.compact()
+    assert event_table.get_full_df()[Event.kind].tolist() == ["c", "c"]
+    assert sum(1 for _ in event_table.paths) == 1
+    event_table.purge()
+
+
+def test_append_log_null_batch(running_template):
+    from src.core import Ping, ping_table
+
+    ping_table: ScruTable
+    ping_table.replace_all(
+        pd.DataFrame({"pid": [1, 2], "kind": ["a", "b"], "source": ["x", None]})
+    )
+    # an all null batch of a nullable str column is inferred as arrow null
+    ping_table.extend(pd.DataFrame({"pid": [3], "kind": ["a"], "source": [None]}))
+    ping_table.replace_records(
+        pd.DataFrame({"pid": [2], "kind": ["b"], "source": [None]})
+    )
+    assert ping_table.peek_schema().field(Ping.source).type == pa.string()
+    merged = ping_table.get_full_df().sort_index()
+    assert merged[Ping.source].isna().tolist() == [False, True, True]
+    ping_table.compact()
+    compacted = ping_table.get_full_df().sort_index()
+    pd.testing.assert_frame_equal(compacted.loc[:, merged.columns], merged)
+    ping_table.purge()
+
+
+def test_buffered_writer(running_template):
+    from src.core import Event, event_table, scrutable
+
+    event_table: ScruTable
+    event_table.purge()
+    with event_table.buffered_writer(max_rows=4) as writer:
+        for i in range(4):
+            writer.extend(pd.DataFrame({"eid": [i], "kind": ["a"], "value": [i]}))
+        writer.replace_records(pd.DataFrame({"eid": [0], "kind": "a", "value": 5}))
+        writer.replace_records(pd.DataFrame({"eid": [0], "kind": "a", "value": 7}))
+        assert event_table.get_full_df().loc[0, Event.value] == 0
+    out = event_table.get_full_df().sort_index()
+    assert out[Event.value].tolist() == [7.0, 1.0, 2.0, 3.0]
+    event_table.purge()
+
+    scrutable: ScruTable
+    with scrutable.buffered_writer(max_bytes=10**9) as writer:
+        writer.extend(
+            pd.DataFrame({"ind": [1], "d": ["2020-01-01"], "num": 1, "c": "A"})
+        )
+        writer.extend(
+            pd.DataFrame({"ind": [2], "d": ["2020-01-02"], "num": 2, "c": "B"})
+        )
+        assert scrutable.get_full_df().empty
+    assert sorted(scrutable.get_full_df().index) == [1, 2]
+    scrutable.purge()
+
+
+def test_stream(running_template):
+    from src.core import Event, event_table
+
+    event_table: ScruTable
+
+    def _gen(n):
+        for i in range(n):
+            yield pd.DataFrame({"eid": [i], "kind": ["a"], "value": [i]})
+
+    event_table.extend(pd.DataFrame({"eid": [100], "kind": ["b"], "value": [1]}))
+    event_table.replace_all_stream(_gen(5))
+    assert sorted(event_table.get_full_df().index) == [0, 1, 2, 3, 4]
+    event_table.extend_stream(_gen(8), chunk_rows=3)
+    assert len(event_table) == 8
+
+    dz.dump_dfs_to_tables([(_gen(2), event_table)])
+    assert event_table.get_full_df()[Event.value].tolist() == [0, 1]
+    dz.dump_dfs_to_tables([(_gen(3), event_table)], verbose=False)
+    assert len(event_table) == 3
+    dz.dump_dfs_to_tables([(_gen(2), event_table)])
+    empty_gen = (pd.DataFrame() for _ in range(2))
+    dz.dump_dfs_to_tables([(empty_gen, event_table)], skip_empty=True)
+    assert len(event_table) == 2
+    event_table.purge()
+
+
+def test_stream_single_file(running_template, monkeypatch):
+    from src.core import Measurement, measurement_table
+
+    measurement_table: ScruTable
+
+    def _gen(start, n):
+        for i in range(start, start + n):
+            yield pd.DataFrame(
+                {
+                    Measurement.mid: [i],
+                    Measurement.level: [i],
+                    Measurement.value: [0.5],
+                    Measurement.count: [None],
+                    Measurement.flag: [True],
+                }
+            )
+
+    def _failing():
+        yield from _gen(100, 2)
+        raise ValueError("source failed")
+
+    def _no_read_back(*args, **kwargs):
+        raise AssertionError("stored file read back")
+
+    measurement_table.replace_all_stream(_gen(0, 3))
+    monkeypatch.setattr(StoredSchemaRepo, "read_table_from_path", _no_read_back)
+    measurement_table.extend_stream(_gen(3, 20), chunk_rows=2)
+    assert len(measurement_table) == 23
+    (path,) = measurement_table.paths
+    assert pq.ParquetFile(path).num_row_groups == 3 + 10
+
+    with pytest.raises(ValueError):
+        measurement_table.replace_all_stream(_failing())
+    assert sorted(measurement_table.get_full_df().index) == [*range(23)]
+    assert not [*path.parent.glob(f"{path.name}*.staging")]
+    measurement_table.purge()
+
+
+def test_concurrent_dump(running_template):
+    from src.core import Event, Note, Reading, event_table, note_table, reading_table
+
+    dfe = pd.DataFrame({Event.eid: [1, 2], Event.kind: ["a", "b"], Event.value: 1})
+    dfn = pd.DataFrame({Note.text: ["x"], Note.author: [None]})
+    dfr = pd.DataFrame(
+        {Reading.rid: [1], Reading.status: ["on"], Reading.note: "x", Reading.level: 1}
+    )
+    pairs = [(dfe, event_table), (dfn, note_table), (dfr, reading_table)]
+    dz.dump_dfs_to_tables(pairs, workers=2)
+    assert [len(t) for _, t in pairs] == [2, 1, 1]
+
+    bad_e, bad_r = dfe.assign(eid=1), dfr.assign(status=None)
+    bad_pairs = [(bad_e, event_table), (dfn, note_table), (bad_r, reading_table)]
+    with pytest.raises(ProjectRuntimeException) as exc_info:
+        dz.dump_dfs_to_tables(bad_pairs, workers=3)
+    errors = exc_info.value.args[1]
+    assert set(errors) == {event_table.id_, reading_table.id_}
+    assert all(isinstance(e, DataConstraintException) for e in errors.values())
+
+    # the same entity in another namespace is a separate table
+    other_event_table = copy(event_table)
+    other_event_table.id_ = replace(event_table.id_, namespace="other")
+    with pytest.raises(ProjectRuntimeException) as exc_info:
+        dz.dump_dfs_to_tables(
+            [(bad_e, other_event_table), (dfe, event_table)], workers=2
+        )
+    assert set(exc_info.value.args[1]) == {other_event_table.id_}
+    assert "other.event" in exc_info.value.args[0]
+    for _, table in pairs:
+        table.purge()
+
+
+def test_manifest(running_template):
+    from src.core import Event, event_table
+
+    event_table: ScruTable
+    event_table.replace_all(
+        pd.DataFrame(
+            {"eid": [1, 2, 3], "kind": ["a", "b", "a"], "value": [1.0, None, 3.0]}
+        )
+    )
+    assert len(event_table) == 3
+    manifest = event_table.get_manifest()
+    assert len(manifest.files) == 2
+    entries = sorted(manifest.files.values(), key=lambda e: e.partition["kind"])
+    assert [e.rows for e in entries] == [2, 1]
+    assert entries[0].columns[Event.value] | {"type": "double"} == {
+        "null_count": 0,
+        "type": "double",
+        "min": 1.0,
+        "max": 3.0,
+    }
+    assert entries[1].columns[Event.value]["null_count"] == 1
+    big_df = event_table.get_full_df(filters=[(Event.value, ">", 2.0)])
+    assert big_df.index.tolist() == [3]
+    assert event_table.query(filters=[(Event.value, ">", 5)]).get_full_df().empty
+
+    # a cache, not versioned, and rebuilt if missing
+    manifest_path = get_manifest_path(event_table.trepo)
+    assert manifest_path not in get_vc_paths(event_table.trepo)
+    manifest_path.unlink()
+    assert len(event_table) == 3
+    event_table.purge()
+    assert len(event_table) == 0
+
+
+def test_head_sample(running_template):
+    from src.core import Event, event_table
+
+    event_table: ScruTable
+    n = 1000
+    df = pd.DataFrame(
+        {"eid": range(n), "kind": ["a", "b"] * (n // 2), "value": range(n)}
+    )
+    event_table.replace_all(df)
+    assert event_table.head().shape[0] == 5
+    assert event_table.head(600)[Event.kind].nunique() == 2
+    assert event_table.query([Event.value]).head(3).columns.tolist() == [Event.value]
+
+    sampled = event_table.sample(50, seed=7)
+    assert sampled.shape[0] == 50
+    assert sampled.index.is_unique
+    pd.testing.assert_frame_equal(sampled, event_table.sample(50, seed=7))
+    sampled_value = sampled[Event.value].astype(int)
+    assert (sampled_value == sampled.index).all()
+    assert event_table.sample(2000).shape[0] == n
+
+    filtered = event_table.query(filters=[(Event.value, "<", 100)]).sample(20)
+    assert filtered.shape[0] == 20
+    assert (filtered[Event.value] < 100).all()
+    assert 300 < event_table.sample(frac=0.5, seed=1).shape[0] < 700
+
+    found = event_table.get_records([3, 10, 999, 5000])
+    assert found.sort_index().index.tolist() == [3, 10, 999]
+    by_frame = event_table.get_records(pd.DataFrame({Event.eid: [4]}), [Event.value])
+    assert by_frame[Event.value].tolist() == [4]
+    assert event_table.get_records([]).empty
+
+    schema = event_table.peek_schema()
+    assert {Event.value, Event.kind, Event.eid} <= set(schema.names)
+    event_table.purge()
+    assert event_table.head().empty
+
+
 def test_run_scrutable(in_template):
     from src.core import scrutable
 
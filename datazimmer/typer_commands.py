@@ -20,6 +20,7 @@ from .naming import (
     BASE_CONF_PATH,
     MAIN_MODULE_NAME,
     README_PATH,
+    RUNTIME_SNAPSHOT_PATH,
     SANDBOX_DIR,
     TEMPLATE_REPO,
     VERSION_PREFIX,
@@ -27,6 +28,7 @@ from .naming import (
     get_tag,
     meta_version_from_tag,
 )
+from .pipeline_dag import run_stages
 from .raw_data import IMPORTED_RAW_DATA_DIR, RAW_DATA_DIR, RAW_ENV_NAME
 from .registry import Registry
 from .sql.draw import dump_graph
@@ -103,6 +105,19 @@ def sql_load(env: str = None, constr: str = "sqlite:///data.db"):
     loader.load_data(env or Config.load().default_env)
 
 
+@app.command()
+def status(env: str = None):
+    """row counts and sizes of the tables of the project, from their manifests"""
+    runtime = get_runtime()
+    for ns in runtime.metadata.namespaces.values():
+        for table in ns.tables:
+            manifest = table.get_manifest(env or runtime.config.default_env)
+            n_files, rows, size = len(manifest.files), manifest.rows, manifest.bytes
+            typer.echo(
+                f"{ns.name}.{table.name}: {rows} rows, {n_files} files, {size} B"
+            )
+
+
 @app.command()
 def set_whoami(first_name: str, last_name: str, orcid: str):
     UserConfig(first_name, last_name, orcid).dump()
@@ -207,6 +222,7 @@ def build_meta(global_conf: bool = False):
         write_project_cron(config.cron)
     runtime = get_runtime()
     write_aswan_crons(runtime.metadata.complete.aswan_projects)
+    runtime.dump_snapshot()
 
 
 @app.command()
@@ -228,6 +244,7 @@ def cleanup():
     conf = Config.load()
     Registry(conf).purge()
     gen_rmtree(SANDBOX_DIR)
+    RUNTIME_SNAPSHOT_PATH.unlink(missing_ok=True)
 
 
 @app.command()
@@ -247,28 +264,36 @@ def run(
     env: str = None,
     commit: bool = False,
     reset_aswan: bool = False,
+    workers: int = 0,
 ):
+    """workers: if given, independent stages run in that many processes
+    instead of one after the other with dvc repro"""
     # TODO: add validation that all scrutables belong somewhere as an output
     # used to have autostage thing
     runtime = get_runtime()
-    stage_names = []
+    stages = {}
     no_cache_outputs = []
     for step in runtime.metadata.complete.pipeline_elements:
         no_cache_outputs.extend(chain(*step.get_no_cache_outs(env)))
-        stage_names.extend(step.add_stages())
+        stages.update(step.get_stages())
     data_sources = []  # TODO
     for dvc_stage_name in dvcu.list_stages():
-        if dvc_stage_name in (stage_names + data_sources):
+        if dvc_stage_name in (list(stages.keys()) + data_sources):
             continue
         logger.info("removing dvc stage", stage=dvc_stage_name)
         dvcu.remove(dvc_stage_name)
-    if not stage_names:
+    if not stages:
         return
+    dvcu.write_stages(stages)
     targets = runtime.step_names_of_env(env) if env else None
     rconf = RunConfig(profile=profile, reset_aswan=reset_aswan)
     with rconf:
-        logger.info("running repro", targets=targets, **asdict(rconf))
-        runs = dvcu.reproduce(targets=targets)
+        if workers:
+            steps = runtime.metadata.complete.pipeline_elements
+            runs = ", ".join(run_stages(steps, targets, workers))
+        else:
+            logger.info("running repro", targets=targets, **asdict(rconf))
+            runs = dvcu.reproduce(targets=targets)
     git_run(add=["dvc.yaml", "dvc.lock", BASE_CONF_PATH, *no_cache_outputs])
     if commit:
         now = dt.datetime.now().isoformat(" ", "minutes")
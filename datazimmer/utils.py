@@ -1,8 +1,8 @@
 import os
 import stat
+import sys
 from contextlib import contextmanager
 from functools import partial
-from inspect import getmodule, stack
 from itertools import chain
 from pathlib import Path
 from shutil import rmtree
@@ -14,17 +14,18 @@ from sqlalchemy.dialects.postgresql import dialect as postgres_dialect
 from structlog import get_logger
 
 LINE_LEN = 119
-PRIMITIVE_MODULES = ["builtins", "datetime"]
+PRIMITIVE_MODULES = ["builtins", "datetime", "numpy"]
 package_root = Path(__file__).parent.parent
 
 logger = get_logger("util")
 
 
 def get_creation_module_name():
-    # stack[2] as 0: utils, 1: dz module, 2: src/metazimmer
+    # frame 2 as 0: utils, 1: dz module, 2: src/metazimmer
+    # only the frame is looked up, inspect.stack would read the source of all
     try:
-        return getmodule(stack()[2][0]).__name__
-    except AttributeError:  # pragma: no cover
+        return sys._getframe(2).f_globals["__name__"]
+    except (ValueError, KeyError):  # pragma: no cover
         logger.warning("can't get module name, likely due to notebook call")
         return None
 
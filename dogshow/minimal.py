@@ -1,5 +1,6 @@
 import datetime as dt
 
+import numpy as np
 import pandas as pd
 
 import datazimmer as dz
@@ -18,10 +19,52 @@ class Thang(dz.AbstractEntity):
     tio = Thing
 
 
+class Event(dz.AbstractEntity):
+    eid = dz.Index & int
+    kind = str
+    value = dz.Nullable(float)
+
+
+class Reading(dz.AbstractEntity):
+    rid = dz.Index & int
+    status = dz.Category(str)
+    note = dz.Nullable(dz.Category(str))
+    level = dz.Category(int)
+
+
+class Note(dz.AbstractEntity):
+    text = str
+    author = dz.Nullable(str)
+
+
+class Measurement(dz.AbstractEntity):
+    mid = dz.Index & np.int32
+    level = np.int16
+    value = np.float32
+    count = dz.Nullable(int)
+    flag = dz.Nullable(bool)
+
+
+class Ping(dz.AbstractEntity):
+    pid = dz.Index & int
+    kind = str
+    source = dz.Nullable(str)
+
+
 scrutable = dz.ScruTable(Thing, partitioning_cols=[Thing.c])
 
 thang_table = dz.ScruTable(Thang, entity_key_table_map={Thang.ti: scrutable})
 
+event_table = dz.ScruTable(Event, partitioning_cols=[Event.kind], append_log=True)
+
+reading_table = dz.ScruTable(Reading)
+
+note_table = dz.ScruTable(Note, arrow_strings=True)
+
+measurement_table = dz.ScruTable(Measurement)
+
+ping_table = dz.ScruTable(Ping, partitioning_cols=[Ping.kind], append_log=True)
+
 
 @dz.register
 def proc():
@@ -29,5 +72,30 @@ def proc():
         {Thing.d: [dt.datetime.now()], Thing.num: [1], Thing.c: ["a"], Thing.ind: [0]}
     )
     dfa = pd.DataFrame({Thang.ti.ind: [0], Thang.tio.ind: [0]})
+    dfe = pd.DataFrame({Event.eid: [0], Event.kind: ["a"], Event.value: [0.5]})
+    dfr = pd.DataFrame(
+        {
+            Reading.rid: [0, 1],
+            Reading.status: ["ok", "ok"],
+            Reading.note: ["x", None],
+            Reading.level: [1, 2],
+        }
+    )
     scrutable.replace_all(dfi)
+    reading_table.replace_all(dfr)
+    note_table.replace_all(pd.DataFrame({Note.text: ["a b"], Note.author: [None]}))
+    dfm = pd.DataFrame(
+        {
+            Measurement.mid: [0, 1],
+            Measurement.level: [3, 4],
+            Measurement.value: [0.5, 1.5],
+            Measurement.count: [10, None],
+            Measurement.flag: [None, True],
+        }
+    )
+    measurement_table.replace_all(dfm)
     thang_table.replace_all(dfa)
+    event_table.replace_all(dfe)
+    ping_table.replace_all(
+        pd.DataFrame({Ping.pid: [0], Ping.kind: ["a"], Ping.source: ["x"]})
+    )